@@ -0,0 +1,84 @@
+import os
+import logging
+import time
+from datetime import date, timedelta
+from typing import Dict, Any, List
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from availability_grid import AvailabilityGrid, CURRENCIES, GRID_MAX_AGE_HOURS
+
+logger = logging.getLogger(__name__)
+
+ALTERNATIVE_MAX_SHIFT_DAYS = int(os.getenv("ALTERNATIVE_MAX_SHIFT_DAYS", "7"))
+ALTERNATIVE_NIGHT_DELTAS = (0, -1, 1)
+ALTERNATIVE_LIMIT = int(os.getenv("ALTERNATIVE_LIMIT", "5"))
+
+
+def cheapest_stay_prices(grid: AvailabilityGrid, occ_idx: int, nights: int, max_age_hours: float) -> np.ndarray:
+    """Cheapest EUR price of a `nights` stay for every check-in date in the grid, NaN where unknown or unavailable.
+
+    Stay lengths the prefetcher covers are read straight from the grid. Other lengths are estimated
+    by summing fresh one-night prices of the same room over a sliding window of consecutive dates.
+    """
+    eur = CURRENCIES.index('EUR')
+    fresh_after = time.time() - max_age_hours * 3600
+    with grid.lock:
+        if nights in grid.nights:
+            night_idx = grid.nights.index(nights)
+            fresh = grid.fetched_at[:, night_idx, occ_idx, eur] >= fresh_after
+            room_prices = np.nanmin(grid.prices[:, night_idx, occ_idx, :, eur, :], axis=-1, initial=np.inf)
+            cheapest = room_prices.min(axis=-1)
+            return np.where(fresh & np.isfinite(cheapest), cheapest, np.nan)
+        if 1 not in grid.nights or nights > grid.days:
+            return np.full(grid.days, np.nan)
+        one_night = grid.nights.index(1)
+        fresh = grid.fetched_at[:, one_night, occ_idx, eur] >= fresh_after
+        nightly = np.nanmin(grid.prices[:, one_night, occ_idx, :, eur, :], axis=-1, initial=np.inf)
+        nightly = np.where(fresh[:, None] & np.isfinite(nightly), nightly, np.nan)
+    # (days - nights + 1, rooms, nights): NaN anywhere in a window makes that room unavailable for the stay
+    window_totals = sliding_window_view(nightly, nights, axis=0).sum(axis=-1)
+    cheapest = np.where(np.isnan(window_totals), np.inf, window_totals).min(axis=-1)
+    stays = np.full(grid.days, np.nan)
+    stays[:len(cheapest)] = np.where(np.isfinite(cheapest), cheapest, np.nan)
+    return stays
+
+def find_alternative_stays(grid: AvailabilityGrid, check_in: date, nights: int, adults: int, children: int,
+                           max_shift_days: int = ALTERNATIVE_MAX_SHIFT_DAYS, limit: int = ALTERNATIVE_LIMIT,
+                           prefer: str = 'closest', max_age_hours: float = GRID_MAX_AGE_HOURS) -> List[Dict[str, Any]]:
+    """Available stays near the requested one, closest first (or cheapest first with prefer='cheapest')."""
+    started = time.perf_counter()
+    if (adults, children) not in grid.occupancies:
+        return []
+    occ_idx = grid.occupancies.index((adults, children))
+    requested_day = (check_in - grid.start).days
+    first_day = max(requested_day - max_shift_days, 0)
+    last_day = min(requested_day + max_shift_days, grid.days - 1)
+    if first_day > last_day:
+        return []
+    days = np.arange(first_day, last_day + 1)
+
+    candidate_nights = [nights + delta for delta in ALTERNATIVE_NIGHT_DELTAS if nights + delta >= 1]
+    prices = np.stack([cheapest_stay_prices(grid, occ_idx, n, max_age_hours)[days] for n in candidate_nights])
+    night_grid = np.array(candidate_nights)[:, None].repeat(len(days), axis=1)
+    day_grid = days[None, :].repeat(len(candidate_nights), axis=0)
+
+    available = ~np.isnan(prices) & ~((day_grid == requested_day) & (night_grid == nights))
+    distance = np.abs(day_grid - requested_day) + np.abs(night_grid - nights)
+    price, distance = prices[available], distance[available]
+    day, stay_nights = day_grid[available], night_grid[available]
+    order = np.lexsort((distance, price) if prefer == 'cheapest' else (price, distance))[:limit]
+
+    alternatives = []
+    for i in order:
+        alternative_check_in = grid.start + timedelta(days=int(day[i]))
+        alternatives.append({
+            'check_in': alternative_check_in,
+            'check_out': alternative_check_in + timedelta(days=int(stay_nights[i])),
+            'nights': int(stay_nights[i]),
+            'price_eur': float(price[i]),
+            'estimated': int(stay_nights[i]) not in grid.nights,
+        })
+    logger.info(f"Found {len(alternatives)} alternative stays in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return alternatives
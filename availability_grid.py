@@ -0,0 +1,275 @@
+import os
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GRID_PATH = os.getenv("AVAILABILITY_GRID_PATH", "availability_grid.npz")
+GRID_DAYS = int(os.getenv("GRID_DAYS", "30"))
+GRID_MAX_AGE_HOURS = float(os.getenv("GRID_MAX_AGE_HOURS", "6"))
+GRID_SAVE_EVERY = int(os.getenv("GRID_SAVE_EVERY", "10"))
+PREFETCH_INTERVAL_SECONDS = int(os.getenv("PREFETCH_INTERVAL_SECONDS", "3600"))
+GRID_NIGHTS = (1, 2, 3, 4, 5, 7)
+GRID_OCCUPANCIES = ((2, 0), (1, 0), (2, 1), (2, 2), (3, 0))
+GRID_MAX_ROOM_TYPES = 16
+CURRENCIES = ('EUR', 'USD')
+POLICIES = ('Non-refundable', 'Free Cancellation')
+
+
+class AvailabilityGrid:
+    """Prices per check-in date x nights x occupancy x room type, with currency and policy as trailing axes.
+
+    Missing prices are NaN. A (date, nights, occupancy, currency) cell counts as answered once
+    fetched_at holds the epoch time of its last scrape; listed marks which room types that scrape showed.
+    """
+
+    def __init__(self, start: date, days: int = GRID_DAYS, nights: Tuple[int, ...] = GRID_NIGHTS,
+                 occupancies: Tuple[Tuple[int, int], ...] = GRID_OCCUPANCIES):
+        self.start = start
+        self.nights = tuple(nights)
+        self.occupancies = tuple(tuple(o) for o in occupancies)
+        self.room_types: List[str] = []
+        cells = (days, len(self.nights), len(self.occupancies))
+        self.prices = np.full(cells + (GRID_MAX_ROOM_TYPES, len(CURRENCIES), len(POLICIES)), np.nan, dtype=np.float32)
+        self.listed = np.zeros(cells + (GRID_MAX_ROOM_TYPES,), dtype=bool)
+        self.fetched_at = np.zeros(cells + (len(CURRENCIES),), dtype=np.float64)
+        self.lock = threading.RLock()
+
+    @property
+    def days(self) -> int:
+        return self.prices.shape[0]
+
+    def cell_index(self, check_in: date, nights: int, adults: int, children: int) -> Optional[Tuple[int, int, int]]:
+        day = (check_in - self.start).days
+        if not 0 <= day < self.days or nights not in self.nights or (adults, children) not in self.occupancies:
+            return None
+        return day, self.nights.index(nights), self.occupancies.index((adults, children))
+
+    def cell_dates(self, cell: Tuple[int, int, int]) -> Tuple[date, int, int, int]:
+        day, night_idx, occ_idx = cell
+        adults, children = self.occupancies[occ_idx]
+        return self.start + timedelta(days=int(day)), self.nights[night_idx], adults, children
+
+    def rebase(self, today: date) -> None:
+        """Drop past check-in dates and open empty ones at the end of the window."""
+        with self.lock:
+            shift = (today - self.start).days
+            if shift <= 0:
+                return
+            shift = min(shift, self.days)
+            self.prices = np.concatenate([self.prices[shift:], np.full_like(self.prices[:shift], np.nan)])
+            self.listed = np.concatenate([self.listed[shift:], np.zeros_like(self.listed[:shift])])
+            self.fetched_at = np.concatenate([self.fetched_at[shift:], np.zeros_like(self.fetched_at[:shift])])
+            self.start = today
+
+    def room_index(self, room_type: str) -> Optional[int]:
+        if room_type not in self.room_types:
+            if len(self.room_types) >= GRID_MAX_ROOM_TYPES:
+                logger.warning(f"Availability grid is full, not tracking room type: {room_type}")
+                return None
+            self.room_types.append(room_type)
+        return self.room_types.index(room_type)
+
+    def update(self, check_in: date, nights: int, adults: int, children: int,
+               availability_data: Dict[str, List[Dict[str, Any]]], fetched_at: Optional[float] = None) -> bool:
+        cell = self.cell_index(check_in, nights, adults, children)
+        if cell is None or not availability_data:
+            return False
+        fetched_at = fetched_at or time.time()
+        scraped = [CURRENCIES.index(currency) for currency in availability_data if currency in CURRENCIES]
+        with self.lock:
+            # Only the scraped currencies are replaced; the others no longer match this room list, so they go stale
+            for currency_idx in range(len(CURRENCIES)):
+                if currency_idx in scraped:
+                    self.prices[cell][:, currency_idx] = np.nan
+                else:
+                    self.fetched_at[cell + (currency_idx,)] = 0
+            self.listed[cell] = False
+            for currency, rooms in availability_data.items():
+                if currency not in CURRENCIES:
+                    continue
+                currency_idx = CURRENCIES.index(currency)
+                complete = True
+                for room in rooms:
+                    room_idx = self.room_index(room['room_type'])
+                    if room_idx is None:
+                        complete = False
+                        continue
+                    self.listed[cell + (room_idx,)] = True
+                    for price_option in room['prices']:
+                        if price_option['cancellation_policy'] not in POLICIES:
+                            complete = False
+                            continue
+                        policy_idx = POLICIES.index(price_option['cancellation_policy'])
+                        self.prices[cell + (room_idx, currency_idx, policy_idx)] = price_option[f"price_{currency.lower()}"]
+                # A room or rate the grid cannot hold would read back as unavailable, so leave the cell to live scrapes
+                self.fetched_at[cell + (currency_idx,)] = fetched_at if complete else 0
+            if not any(availability_data.values()):
+                # No rooms at all is the same answer in every currency
+                self.fetched_at[cell] = fetched_at
+        return True
+
+    def lookup(self, check_in: date, nights: int, adults: int, children: int, free_cancellation_date: Optional[date],
+               max_age_hours: float = GRID_MAX_AGE_HOURS) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Return scraper-shaped availability data for a fresh cell, or None on a miss."""
+        cell = self.cell_index(check_in, nights, adults, children)
+        if cell is None:
+            return None
+        with self.lock:
+            oldest_allowed = time.time() - max_age_hours * 3600
+            fresh = self.fetched_at[cell] >= oldest_allowed
+            if not fresh[CURRENCIES.index('EUR')]:
+                return None
+            listed = np.flatnonzero(self.listed[cell])
+            prices = self.prices[cell]
+            availability_data = {}
+            for currency_idx in np.flatnonzero(fresh):
+                currency = CURRENCIES[currency_idx]
+                rooms = []
+                for room_idx in listed:
+                    room_prices = [
+                        {
+                            f"price_{currency.lower()}": float(prices[room_idx, currency_idx, policy_idx]),
+                            "cancellation_policy": policy,
+                            "free_cancellation_date": free_cancellation_date if policy == "Free Cancellation" else None,
+                        }
+                        for policy_idx, policy in enumerate(POLICIES)
+                        if not np.isnan(prices[room_idx, currency_idx, policy_idx])
+                    ]
+                    rooms.append({
+                        "room_type": self.room_types[room_idx],
+                        "prices": room_prices,
+                        "availability": "Available" if room_prices else "Not Available",
+                    })
+                availability_data[currency] = rooms
+            return availability_data
+
+    def stale_cells(self, max_age_hours: float = GRID_MAX_AGE_HOURS) -> np.ndarray:
+        """Cells whose oldest currency is past max age, stalest first, as an (n, 3) index array."""
+        with self.lock:
+            oldest = self.fetched_at.min(axis=-1)
+            stale = np.argwhere(oldest < time.time() - max_age_hours * 3600)
+            return stale[np.argsort(oldest[tuple(stale.T)], kind='stable')]
+
+    def save(self, path: str = GRID_PATH) -> None:
+        with self.lock:
+            tmp_path = f"{path}.tmp.npz"
+            np.savez_compressed(
+                tmp_path,
+                start=np.array(self.start.toordinal()),
+                nights=np.array(self.nights),
+                occupancies=np.array(self.occupancies),
+                room_types=np.array(self.room_types, dtype=str),
+                prices=self.prices,
+                listed=self.listed,
+                fetched_at=self.fetched_at,
+            )
+            os.replace(tmp_path, path)
+        logger.info(f"Saved availability grid to {path}")
+
+    @classmethod
+    def load(cls, path: str = GRID_PATH) -> 'AvailabilityGrid':
+        with np.load(path) as data:
+            grid = cls(date.fromordinal(int(data['start'])), data['prices'].shape[0],
+                       tuple(int(n) for n in data['nights']), tuple(map(tuple, data['occupancies'].tolist())))
+            grid.room_types = [str(room_type) for room_type in data['room_types']]
+            grid.prices = data['prices']
+            grid.listed = data['listed']
+            grid.fetched_at = data['fetched_at']
+        grid.rebase(datetime.now().date())
+        return grid
+
+
+_grid_cache: Dict[str, Tuple[float, AvailabilityGrid]] = {}
+
+def load_grid(path: str = GRID_PATH) -> AvailabilityGrid:
+    """Load the grid from disk, reusing the in-memory copy until the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    cached = _grid_cache.get(path)
+    if cached and cached[0] == mtime:
+        cached[1].rebase(datetime.now().date())
+        return cached[1]
+    if mtime is None:
+        grid = AvailabilityGrid(datetime.now().date())
+    else:
+        try:
+            grid = AvailabilityGrid.load(path)
+        except Exception as e:
+            logger.error(f"Failed to load availability grid from {path}, starting empty: {e}")
+            grid = AvailabilityGrid(datetime.now().date())
+    _grid_cache[path] = (mtime, grid)
+    return grid
+
+def store_in_grid(check_in: date, nights: int, adults: int, children: int,
+                  availability_data: Dict[str, List[Dict[str, Any]]], path: str = GRID_PATH) -> None:
+    grid = load_grid(path)
+    if grid.update(check_in, nights, adults, children, availability_data):
+        grid.save(path)
+        _grid_cache[path] = (os.path.getmtime(path), grid)
+
+def prefetch_once(scrape: Callable, path: str = GRID_PATH, max_age_hours: float = GRID_MAX_AGE_HOURS,
+                  stop_event: Optional[threading.Event] = None, budget_seconds: Optional[float] = None) -> int:
+    """Scrape stale cells, stalest first, saving the grid every few cells, until done or out of budget. Returns cells refreshed."""
+    started = time.monotonic()
+    grid = load_grid(path)
+    stale = grid.stale_cells(max_age_hours)
+    logger.info(f"Prefetching {len(stale)} stale availability grid cells")
+    refreshed = 0
+    for cell in stale:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if budget_seconds is not None and time.monotonic() - started > budget_seconds:
+            logger.info(f"Prefetch budget of {budget_seconds:.0f}s used up")
+            break
+        check_in, nights, adults, children = grid.cell_dates(tuple(cell))
+        try:
+            availability_data = scrape(check_in, check_in + timedelta(days=nights), adults, children)
+        except Exception as e:
+            logger.error(f"Prefetch failed for {check_in} x {nights} nights x {adults}+{children}: {e}")
+            continue
+        if grid.update(check_in, nights, adults, children, availability_data):
+            refreshed += 1
+            if refreshed % GRID_SAVE_EVERY == 0:
+                grid.save(path)
+    grid.save(path)
+    _grid_cache[path] = (os.path.getmtime(path), grid)
+    logger.info(f"Prefetch pass refreshed {refreshed} of {len(stale)} cells")
+    return refreshed
+
+def start_prefetcher(scrape: Callable, path: str = GRID_PATH, interval_seconds: int = PREFETCH_INTERVAL_SECONDS,
+                     budget_seconds: Optional[float] = None,
+                     on_exit: Optional[Callable[[], None]] = None) -> Tuple[threading.Event, threading.Thread]:
+    """Run prefetch passes on a daemon thread until the returned event is set, then call on_exit on that thread."""
+    stop_event = threading.Event()
+
+    def run():
+        try:
+            while not stop_event.is_set():
+                try:
+                    prefetch_once(scrape, path, stop_event=stop_event, budget_seconds=budget_seconds)
+                except Exception as e:
+                    logger.error(f"Prefetch pass failed: {type(e).__name__}: {e}")
+                stop_event.wait(interval_seconds)
+        finally:
+            if on_exit is not None:
+                on_exit()
+
+    thread = threading.Thread(target=run, name="availability-prefetcher", daemon=True)
+    thread.start()
+    return stop_event, thread
+
+
+if __name__ == "__main__":
+    from demail_processor import scrape_thekokoon_availability
+
+    while True:
+        prefetch_once(scrape_thekokoon_availability)
+        time.sleep(PREFETCH_INTERVAL_SECONDS)
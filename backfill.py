@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from email import policy
+from email.parser import BytesParser
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", "500"))
+BACKFILL_EXTRACTORS = ('folder_patterns', 'email_processor_patterns', 'offline')
+MANIFEST_NAME = "manifest.json"
+
+_worker_extract = None
+
+
+def init_worker(extractor: str) -> None:
+    """Load the extractor once per worker process so its module-level patterns compile once."""
+    global _worker_extract
+    from extractor_eval import get_extractor
+    _worker_extract = get_extractor(extractor)
+    if _worker_extract is None:
+        raise RuntimeError(f"Extractor {extractor} is unavailable")
+    # The extractors log every step at INFO, which costs more than the parsing itself
+    logging.getLogger().setLevel(logging.WARNING)
+
+def message_text(msg) -> str:
+    part = msg.get_body(preferencelist=('plain', 'html'))
+    if part is None:
+        return ''
+    try:
+        content = part.get_content()
+    except (LookupError, UnicodeError):
+        content = part.get_payload(decode=True).decode('utf-8', errors='replace')
+    if part.get_content_type() == 'text/html':
+        content = BeautifulSoup(content, 'html.parser').get_text('\n')
+    return content
+
+def extract_chunk(items: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    from extractor_eval import normalize_fields
+    from date_grammar import reference_date_scope
+    rows = []
+    for key, raw in items:
+        row: Dict[str, Any] = {'source': key, 'sender': None, 'received': None, 'error': None}
+        try:
+            msg = BytesParser(policy=policy.default).parsebytes(raw)
+            row['sender'] = parseaddr(str(msg.get('From', '')))[1]
+            received = None
+            try:
+                received = parsedate_to_datetime(str(msg['Date'])).date()
+                row['received'] = received.isoformat()
+            except (TypeError, ValueError):
+                pass
+            # Year-less and relative dates belong to the year the guest wrote in, or every lead time is off by years
+            with reference_date_scope(received):
+                reservation_info = _worker_extract(message_text(msg)) or {}
+            row.update(normalize_fields(reservation_info))
+            row['rooms'] = reservation_info.get('rooms')
+        except Exception as e:
+            row['error'] = f"{type(e).__name__}: {e}"
+        rows.append(row)
+    return rows
+
+
+def chunk_path(output_dir: str, chunk_index: int) -> str:
+    return os.path.join(output_dir, f"chunk-{chunk_index:06d}.jsonl")
+
+def write_chunk(output_dir: str, chunk_index: int, rows: List[Dict[str, Any]]) -> None:
+    path = chunk_path(output_dir, chunk_index)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+    os.replace(f"{path}.tmp", path)
+
+def check_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """Chunk numbers only line up across runs for the same source, extractor and chunk size."""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved != manifest:
+            raise ValueError(f"{output_dir} holds a backfill of {saved}, not {manifest}; use another output directory")
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+def iter_pending_chunks(messages: Iterator[Tuple[str, bytes]], output_dir: str, chunk_size: int) -> Iterator[Tuple[int, List[Tuple[str, bytes]]]]:
+    chunk: List[Tuple[str, bytes]] = []
+    chunk_index = 0
+    for item in messages:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            if not os.path.exists(chunk_path(output_dir, chunk_index)):
+                yield chunk_index, chunk
+            chunk, chunk_index = [], chunk_index + 1
+    if chunk and not os.path.exists(chunk_path(output_dir, chunk_index)):
+        yield chunk_index, chunk
+
+def collect(pending: Dict[Any, int], output_dir: str, done) -> int:
+    processed = 0
+    for future in done:
+        chunk_index = pending.pop(future)
+        rows = future.result()
+        write_chunk(output_dir, chunk_index, rows)
+        processed += len(rows)
+    return processed
+
+
+def backfill(source: str, output_dir: str, extractor: str = 'folder_patterns', source_format: str = 'auto',
+             workers: Optional[int] = None, chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    from replay_mail import iter_source
+
+    os.makedirs(output_dir, exist_ok=True)
+    check_manifest(output_dir, {'source': os.path.abspath(source), 'extractor': extractor, 'chunk_size': chunk_size})
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(extractor,)) as pool:
+        pending = {}
+        for chunk_index, chunk in iter_pending_chunks(iter_source(source, source_format), output_dir, chunk_size):
+            # Keep only a couple of chunks per worker in flight so a large archive is never held in memory whole
+            if len(pending) >= workers * 2:
+                processed += collect(pending, output_dir, wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[pool.submit(extract_chunk, chunk)] = chunk_index
+        processed += collect(pending, output_dir, wait(pending).done)
+    elapsed = time.perf_counter() - started
+    logger.warning(f"Backfilled {processed} messages with {workers} workers in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.0f}/s)")
+    return processed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run a local extractor over a mail archive on every core")
+    arg_parser.add_argument("source", help="mbox file, maildir, or directory of .eml files")
+    arg_parser.add_argument("output_dir", help="Directory for chunk-NNNNNN.jsonl results; rerun with the same arguments to resume")
+    arg_parser.add_argument("--extractor", choices=BACKFILL_EXTRACTORS, default='folder_patterns')
+    arg_parser.add_argument("--format", dest="source_format", choices=('auto', 'mbox', 'maildir', 'eml'), default='auto')
+    arg_parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the CPU count")
+    arg_parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    args = arg_parser.parse_args()
+
+    backfill(args.source, args.output_dir, args.extractor, args.source_format, args.workers, args.chunk_size)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
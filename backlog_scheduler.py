@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import time
+import logging
+from datetime import date, datetime, timedelta
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, List, Tuple
+
+from text_normalization import fold
+
+logger = logging.getLogger(__name__)
+
+RUN_BUDGET_SECONDS = float(os.getenv("RUN_BUDGET_SECONDS", "1800"))
+BACKLOG_CHUNK_SIZE = int(os.getenv("BACKLOG_CHUNK_SIZE", "25"))
+BACKLOG_CHECKPOINT_PATH = os.getenv("BACKLOG_CHECKPOINT_PATH", "backlog_checkpoint.json")
+# Messages without a recognisable date rank as if the guest wanted to arrive this many days out
+UNKNOWN_CHECK_IN_DAYS = int(os.getenv("UNKNOWN_CHECK_IN_DAYS", "30"))
+PREVIEW_BYTES = 2048
+PREVIEW_FETCH = f"(BODY.PEEK[HEADER.FIELDS (DATE SUBJECT)] BODY.PEEK[TEXT]<0.{PREVIEW_BYTES}>)"
+
+MONTH_PREFIXES = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+    'ιαν': 1, 'φεβ': 2, 'μαρ': 3, 'απρ': 4, 'μαι': 5, 'ιουν': 6,
+    'ιουλ': 7, 'αυγ': 8, 'σεπ': 9, 'οκτ': 10, 'νοε': 11, 'δεκ': 12,
+}
+NUMERIC_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2,4}))?\b')
+TEXTUAL_DATE = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?\s+([a-zα-ω]{3,})')
+SEQUENCE_START = re.compile(rb'^\d+ \(')
+UID_PATTERN = re.compile(rb'UID (\d+)')
+
+
+def _candidate_date(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    if year is not None and year < 100:
+        year += 2000
+    try:
+        candidate = date(year or today.year, month, day)
+    except ValueError:
+        return None
+    if year is None and candidate < today:
+        candidate = candidate.replace(year=today.year + 1)
+    return candidate if candidate >= today else None
+
+def quick_check_in(text: str, today: date) -> Optional[date]:
+    """Earliest future date mentioned in the text. Good enough to rank messages, not to book them."""
+    text = fold(text)
+    candidates = []
+    for day, month, year in NUMERIC_DATE.findall(text):
+        candidates.append(_candidate_date(int(day), int(month), int(year) if year else None, today))
+    for day, month_word in TEXTUAL_DATE.findall(text):
+        month = MONTH_PREFIXES.get(month_word[:4]) or MONTH_PREFIXES.get(month_word[:3])
+        if month:
+            candidates.append(_candidate_date(int(day), month, None, today))
+    candidates = [c for c in candidates if c is not None]
+    return min(candidates) if candidates else None
+
+def urgency_key(check_in: Optional[date], received_at: float, today: date) -> Tuple[date, float]:
+    """Soonest check-in first, then oldest message first."""
+    return check_in or today + timedelta(days=UNKNOWN_CHECK_IN_DAYS), received_at
+
+def parse_preview_response(fetch_data: List[Any]) -> Dict[bytes, Dict[str, bytes]]:
+    """Group a UID FETCH PREVIEW_FETCH response into {uid: {'header': ..., 'text': ...}}."""
+    previews: Dict[bytes, Dict[str, bytes]] = {}
+    current: Dict[str, bytes] = {}
+    uid = None
+    for item in fetch_data:
+        prefix = item[0] if isinstance(item, tuple) else item
+        if not isinstance(prefix, bytes):
+            continue
+        if SEQUENCE_START.match(prefix):
+            current, uid = {}, None
+        uid_match = UID_PATTERN.search(prefix)
+        if uid_match:
+            uid = uid_match.group(1)
+            previews[uid] = current
+        if isinstance(item, tuple):
+            current['header' if b'HEADER.FIELDS' in prefix else 'text'] = item[1]
+    return previews
+
+def rank_messages(previews: Dict[bytes, Dict[str, bytes]], today: date) -> List[bytes]:
+    ranked = []
+    for uid, preview in previews.items():
+        headers = BytesHeaderParser().parsebytes(preview.get('header', b''))
+        try:
+            received_at = parsedate_to_datetime(headers['Date']).timestamp()
+        except (TypeError, ValueError):
+            received_at = time.time()
+        preview_text = f"{headers.get('Subject', '')}\n{preview.get('text', b'').decode('utf-8', errors='replace')}"
+        ranked.append((urgency_key(quick_check_in(preview_text, today), received_at, today), uid))
+    ranked.sort()
+    return [uid for _, uid in ranked]
+
+
+class BacklogCheckpoint:
+    """UIDs already handled in this mailbox, so an interrupted drain resumes where it stopped."""
+
+    def __init__(self, uidvalidity: str, path: str = BACKLOG_CHECKPOINT_PATH):
+        self.path = path
+        self.uidvalidity = uidvalidity
+        self.done = set()
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    saved = json.load(f)
+                if saved.get('uidvalidity') == uidvalidity:
+                    self.done = set(saved.get('done', []))
+                else:
+                    logger.info("Mailbox UIDVALIDITY changed, discarding backlog checkpoint")
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read backlog checkpoint {path}: {e}")
+
+    def is_done(self, uid: bytes) -> bool:
+        return uid.decode() in self.done
+
+    def mark(self, uid: bytes) -> None:
+        self.done.add(uid.decode())
+
+    def prune(self, pending_uids: List[bytes]) -> None:
+        # Only UIDs still unseen can come back, so older ones need not be remembered
+        self.done &= {uid.decode() for uid in pending_uids}
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'uidvalidity': self.uidvalidity, 'done': sorted(self.done, key=int), 'saved_at': datetime.now().isoformat()}, f)
+        os.replace(tmp_path, self.path)
+
+
+def chunks(items: List[Any], size: int = BACKLOG_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
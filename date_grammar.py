@@ -0,0 +1,341 @@
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from text_normalization import normalize
+
+ENGLISH_MONTHS = (
+    'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december',
+)
+# Folded Greek stems: formal names inflect as -οσ/-ου/-ο, colloquial ones (Γενάρης, Μάρτη) as -ησ/-η
+GREEK_MONTH_STEMS = (
+    ('ιανουαρι', 'γεναρ'), ('φεβρουαρι', 'φλεβαρ'), ('μαρτι', 'μαρτ'), ('απριλι', 'απριλ'),
+    ('μαι', 'μα'), ('ιουνι', 'ιουν'), ('ιουλι', 'ιουλ'), ('αυγουστ', None),
+    ('σεπτεμβρι', 'σεπτεμβρ'), ('οκτωβρι', 'οκτωβρ'), ('νοεμβρι', 'νοεμβρ'), ('δεκεμβρι', 'δεκεμβρ'),
+)
+FORMAL_SUFFIXES = ('οσ', 'ου', 'ο')
+COLLOQUIAL_SUFFIXES = ('ησ', 'η')
+# Besides the full names and their inflections only these abbreviations are months; "οκτω" or "marc" are not
+MONTH_ABBREVIATIONS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'sept': 9, 'oct': 10,
+    'nov': 11, 'dec': 12,
+    'ιαν': 1, 'φεβ': 2, 'μαρ': 3, 'απρ': 4, 'μαι': 5, 'ιουν': 6, 'ιουλ': 7, 'αυγ': 8, 'σεπ': 9, 'σεπτ': 9,
+    'οκτ': 10, 'νοε': 11, 'νοεμ': 11, 'δεκ': 12,
+}
+
+RANGE_WORDS = {'to', 'till', 'until', 'through', 'εωσ', 'μεχρι', 'ωσ'}
+# "between 10 and 14 June", "μεταξύ 10 και 14 Ιουνίου"
+BETWEEN_WORDS = {'between', 'μεταξυ'}
+AND_WORDS = {'and', 'και'}
+# Allowed between a day and its month: "5th of May", "3 του Μαΐου"
+DAY_MONTH_FILLERS = {'of', 'the', 'του', 'τησ'}
+RANGE_SEPARATORS = {'-', '–'}
+
+TOKEN = re.compile(
+    r'(?P<num>\d{1,4})(?:(?P<ord>st|nd|rd|th|ησ|η)(?![a-zα-ω]))?'
+    r'|(?P<word>[a-zα-ω]+)'
+    r'|(?P<sep>[/.\-–])'
+    r'|(?P<comma>,)'
+    r'|(?P<space>\s+)'
+    r'|(?P<other>.)',
+    re.DOTALL,
+)
+
+
+_reference = threading.local()
+
+@contextmanager
+def reference_date_scope(today: Optional[date]):
+    """Resolve year-less and relative dates against `today` instead of the clock, e.g. an archived message's Date."""
+    previous = getattr(_reference, 'today', None)
+    _reference.today = today
+    try:
+        yield
+    finally:
+        _reference.today = previous
+
+def reference_today() -> date:
+    return getattr(_reference, 'today', None) or date.today()
+
+
+class MonthTrie:
+    """Month names, their inflections and known abbreviations; only a whole word matches."""
+
+    def __init__(self):
+        self.root: Dict = {}
+
+    def add(self, word: str, month: int) -> None:
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = month
+
+    def lookup(self, word: str) -> Optional[int]:
+        node = self.root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get('')
+
+def _build_month_trie() -> MonthTrie:
+    trie = MonthTrie()
+    for month, name in enumerate(ENGLISH_MONTHS, 1):
+        trie.add(name, month)
+    for month, (formal, colloquial) in enumerate(GREEK_MONTH_STEMS, 1):
+        for suffix in FORMAL_SUFFIXES:
+            trie.add(formal + suffix, month)
+        if colloquial:
+            for suffix in COLLOQUIAL_SUFFIXES:
+                trie.add(colloquial + suffix, month)
+    for abbreviation, month in MONTH_ABBREVIATIONS.items():
+        trie.add(abbreviation, month)
+    return trie
+
+MONTH_TRIE = _build_month_trie()
+
+
+class Token(NamedTuple):
+    kind: str
+    value: object
+    start: int
+    end: int
+    digits: int = 0
+
+
+class DateMatch(NamedTuple):
+    start: date
+    end: Optional[date]
+    span: Tuple[int, int]
+
+
+def tokenize(folded: str) -> List[Token]:
+    tokens = []
+    for match in TOKEN.finditer(folded):
+        # lastgroup would name the ordinal suffix rather than the number it belongs to
+        kind = 'num' if match.group('num') else match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'num':
+            number = match.group('num')
+            tokens.append(Token('num', int(number), match.start(), match.end(), len(number)))
+        elif kind == 'word':
+            word = match.group()
+            month = MONTH_TRIE.lookup(word)
+            if month:
+                tokens.append(Token('month', month, match.start(), match.end()))
+            elif word in RANGE_WORDS:
+                tokens.append(Token('range', word, match.start(), match.end()))
+            else:
+                tokens.append(Token('word', word, match.start(), match.end()))
+        else:
+            tokens.append(Token(kind, match.group(), match.start(), match.end()))
+    return tokens
+
+
+def _resolve(day: int, month: int, year: Optional[int], today: date) -> Optional[date]:
+    """A date from its parts; without a year it is the next occurrence on or after today."""
+    if year is not None and year < 100:
+        year += 2000
+    try:
+        resolved = date(year or today.year, month, day)
+    except ValueError:
+        return None
+    if year is None and resolved < today:
+        try:
+            resolved = resolved.replace(year=today.year + 1)
+        except ValueError:
+            return None
+    return resolved
+
+def _resolve_range(first: Tuple[int, int], last: Tuple[int, int, Optional[int]], today: date) -> Optional[Tuple[date, date]]:
+    day, month = first
+    end_day, end_month, year = last
+    if year is not None:
+        end = _resolve(end_day, end_month, year, today)
+        start = _resolve(day, month, year, today)
+        if start and end and start > end:
+            start = _resolve(day, month, end.year - 1, today)
+    else:
+        start = _resolve(day, month, None, today)
+        end = _resolve(end_day, end_month, start.year if start else None, today)
+        if start and end and end < start:
+            end = _resolve(end_day, end_month, start.year + 1, today)
+    if start is None or end is None:
+        return None
+    return start, end
+
+
+class _Scanner:
+    """Recursive-descent productions over the token list; each returns (parts, next index) or None."""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+
+    def at(self, i: int, kind: str) -> Optional[Token]:
+        if i < len(self.tokens) and self.tokens[i].kind == kind:
+            return self.tokens[i]
+        return None
+
+    def adjacent(self, i: int) -> bool:
+        return 0 < i < len(self.tokens) and self.tokens[i - 1].end == self.tokens[i].start
+
+    def connector(self, i: int) -> bool:
+        token = self.tokens[i] if i < len(self.tokens) else None
+        return token is not None and (token.kind == 'range' or (token.kind == 'sep' and token.value in RANGE_SEPARATORS))
+
+    def year(self, i: int):
+        if self.at(i, 'comma'):
+            i += 1
+        token = self.at(i, 'num')
+        if token and token.digits == 4 and 2000 <= token.value < 2100:
+            return token.value, i + 1
+        return None, i
+
+    def numeric(self, i: int):
+        """DD/MM[/YY[YY]] or YYYY-MM-DD, written without spaces."""
+        first, sep, second = self.at(i, 'num'), self.at(i + 1, 'sep'), self.at(i + 2, 'num')
+        if not (first and sep and second and self.adjacent(i + 1) and self.adjacent(i + 2)):
+            return None
+        third = self.at(i + 4, 'num') if self.at(i + 3, 'sep') and self.tokens[i + 3].value == sep.value and self.adjacent(i + 3) and self.adjacent(i + 4) else None
+        if first.digits == 4:
+            if third and 1 <= second.value <= 12:
+                return (third.value, second.value, first.value), i + 5
+            return None
+        if not (1 <= first.value <= 31 and 1 <= second.value <= 12 and second.digits <= 2):
+            return None
+        if third and third.digits in (2, 4):
+            return (first.value, second.value, third.value), i + 5
+        # 3.5 is a number, not the 3rd of May
+        if sep.value == '.' and second.digits == 1:
+            return None
+        return (first.value, second.value, None), i + 3
+
+    def day_month(self, i: int):
+        """DD[st] [of] Month [YYYY]."""
+        day = self.at(i, 'num')
+        month_index = i + 1
+        while month_index < len(self.tokens) and self.tokens[month_index].kind == 'word' and self.tokens[month_index].value in DAY_MONTH_FILLERS:
+            month_index += 1
+        month = self.at(month_index, 'month')
+        if not (day and month and day.digits <= 2 and 1 <= day.value <= 31):
+            return None
+        year, end = self.year(month_index + 1)
+        return (day.value, month.value, year), end
+
+    def month_day(self, i: int):
+        """Month DD[st][,] [YYYY]."""
+        month, day = self.at(i, 'month'), self.at(i + 1, 'num')
+        if not (month and day and day.digits <= 2 and 1 <= day.value <= 31):
+            return None
+        year, end = self.year(i + 2)
+        return (day.value, month.value, year), end
+
+    def word(self, i: int, words) -> bool:
+        token = self.at(i, 'word')
+        return token is not None and token.value in words
+
+    def single(self, i: int):
+        return self.numeric(i) or self.day_month(i) or self.month_day(i)
+
+    def day_range(self, i: int):
+        """10-14/8, 3 έως 7 Ιουλίου, 10-14 august, august 10-14."""
+        first = self.at(i, 'num')
+        if first and first.digits <= 2 and 1 <= first.value <= 31 and self.connector(i + 1):
+            connector = self.tokens[i + 1]
+            rest = self.numeric(i + 2) or self.day_month(i + 2)
+            # 10-12-2026 is a single date, not a range ending on 12/2026
+            if rest and not (connector.kind == 'sep' and self.at(i + 3, 'sep') and self.tokens[i + 3].value == connector.value):
+                (end_day, month, year), end = rest
+                return ((first.value, month), (end_day, month, year)), end
+        month = self.at(i, 'month')
+        if month and self.at(i + 1, 'num') and self.connector(i + 2) and self.at(i + 3, 'num'):
+            start_day, end_day = self.tokens[i + 1].value, self.tokens[i + 3].value
+            if 1 <= start_day <= 31 and 1 <= end_day <= 31:
+                year, end = self.year(i + 4)
+                return ((start_day, month.value), (end_day, month.value, year)), end
+        return None
+
+    def between(self, i: int):
+        """between 10 and 14 June, between 10/6 and 14/6, between June 10 and 14."""
+        if not self.word(i, BETWEEN_WORDS):
+            return None
+        first = self.single(i + 1)
+        if first:
+            (day, month, year), after = first
+            if not self.word(after, AND_WORDS):
+                return None
+            last = self.single(after + 1)
+            if last:
+                (end_day, end_month, end_year), end = last
+                return ((day, month), (end_day, end_month, end_year or year)), end
+            end_day = self.at(after + 1, 'num')
+            if end_day and end_day.digits <= 2 and 1 <= end_day.value <= 31:
+                end_year, end = self.year(after + 2)
+                return ((day, month), (end_day.value, month, end_year or year)), end
+            return None
+        first = self.at(i + 1, 'num')
+        if first and first.digits <= 2 and 1 <= first.value <= 31 and self.word(i + 2, AND_WORDS):
+            rest = self.numeric(i + 3) or self.day_month(i + 3)
+            if rest:
+                (end_day, month, year), end = rest
+                return ((first.value, month), (end_day, month, year)), end
+        return None
+
+
+def find_dates(text: str, today: Optional[date] = None) -> List[DateMatch]:
+    """Every date and date range in the text, in order, from one pass over its tokens."""
+    today = today or reference_today()
+    tokens = tokenize(normalize(text).folded)
+    scanner = _Scanner(tokens)
+    matches: List[Tuple[DateMatch, int, int]] = []
+    i = 0
+    while i < len(tokens):
+        ranged = scanner.between(i) or scanner.day_range(i)
+        if ranged:
+            (first, last), end = ranged
+            resolved = _resolve_range(first, last, today)
+            if resolved:
+                matches.append((DateMatch(resolved[0], resolved[1], (tokens[i].start, tokens[end - 1].end)), i, end))
+                i = end
+                continue
+        single = scanner.single(i)
+        if single:
+            (day, month, year), end = single
+            resolved = _resolve(day, month, year, today)
+            if resolved:
+                matches.append((DateMatch(resolved, None, (tokens[i].start, tokens[end - 1].end)), i, end))
+                i = end
+                continue
+        i += 1
+
+    # Two single dates joined only by a connector ("3/7 - 7/7", "1 july to 5 july") form a range
+    merged: List[DateMatch] = []
+    previous_end = None
+    for match, start_index, end_index in matches:
+        if (merged and merged[-1].end is None and match.end is None and previous_end is not None
+                and start_index == previous_end + 1 and scanner.connector(previous_end)):
+            start = merged[-1].start
+            end = match.start if match.start > start else _resolve(match.start.day, match.start.month, start.year + 1, today)
+            merged[-1] = DateMatch(start, end, (merged[-1].span[0], match.span[1]))
+        else:
+            merged.append(match)
+        previous_end = end_index
+    return merged
+
+def parse_date_text(text: str, today: Optional[date] = None) -> Optional[date]:
+    matches = find_dates(text, today)
+    return matches[0].start if matches else None
+
+def find_stay(text: str, today: Optional[date] = None) -> Optional[Tuple[date, Optional[date]]]:
+    """Check-in and check-out: the first range, else the first two dates in order, else one date alone."""
+    matches = find_dates(text, today)
+    for match in matches:
+        if match.end is not None and match.end > match.start:
+            return match.start, match.end
+    if len(matches) >= 2 and matches[1].start > matches[0].start:
+        return matches[0].start, matches[1].start
+    return (matches[0].start, None) if matches else None
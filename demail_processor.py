@@ -1,15 +1,24 @@
 import os
 import logging
 import re
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
+from collections import defaultdict
 from datetime import datetime, timedelta, date
 import time
+import threading
+from contextlib import contextmanager
 import traceback
+from urllib.parse import urlparse
 
 import imaplib
 import smtplib
 import email
-from email.header import decode_header
+import base64
+import codecs
+import quopri
+from email import policy
+from email.message import Message
+from email.parser import BytesParser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
@@ -17,12 +26,30 @@ import requests
 from requests.exceptions import RequestException
 from bs4 import BeautifulSoup
 import ssl
+from html.parser import HTMLParser
 
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
 from dateutil import parser as date_parser
 import dateparser
-from transliterate import detect_language as transliterate_detect_language
+
+from availability_grid import load_grid, store_in_grid, start_prefetcher
+from alternative_dates import find_alternative_stays
+from inquiry_dedupe import get_inquiry_index
+from mail_triage import triage_email, log_triage_counts, INQUIRY
+from extractor_eval import submit_shadow, shutdown_shadow
+from backlog_scheduler import (
+    BacklogCheckpoint, PREVIEW_FETCH, RUN_BUDGET_SECONDS, BACKLOG_CHUNK_SIZE, chunks, parse_preview_response, rank_messages
+)
+from resilience import (
+    CircuitBreaker, CircuitOpenError, RateLimiter, DeadlineExceeded, current_deadline, deadline_scope, EMAIL_DEADLINE_SECONDS,
+    rate_limiter, log_rate_limit_stats,
+)
+from reservation_store import get_reservation_store
+from staff_digest import STAFF_DIGEST_MODE, is_urgent, render_digest, staff_digest
+from text_normalization import normalize
+from date_grammar import parse_date_text, reference_today
+from offline_resolver import extract_offline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,30 +64,241 @@ if not OPEN_ROUTER_API_KEY:
 
 OPEN_ROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-def normalize_text(text: str) -> str:
-    logger.debug(f"Normalizing text: {text[:50]}...")
-    return text.lower()
+# Extraction routing: every email starts on the fast model and only escalates when its answer fails validation
+OPEN_ROUTER_FAST_MODEL = os.getenv("OPEN_ROUTER_FAST_MODEL", "openai/gpt-4o-mini")
+OPEN_ROUTER_SLOW_MODEL = os.getenv("OPEN_ROUTER_SLOW_MODEL", "openai/gpt-4o")
+EXTRACTION_ROUTES = [('fast', OPEN_ROUTER_FAST_MODEL), ('slow', OPEN_ROUTER_SLOW_MODEL)]
+# Emails whose stay and party size resolve without a model (explicit or relative dates, holidays,
+# number words) skip the routes above entirely
+OFFLINE_EXTRACTION = os.getenv("OFFLINE_EXTRACTION", "1") == "1"
+EXTRACTION_PROMPT_VERSION = "v3"
+EXTRACTION_PROMPT = """Extract the reservation request from the email below. Today is {today}.
+Reply with exactly these lines and nothing else:
+Check-in: YYYY-MM-DD or null
+Check-out: YYYY-MM-DD or null
+Nights: number or null
+Days: number or null
+Adults: number
+Children: number
+Rooms: number
+Room Type: text or null
+Rules: fill dates, nights and days only when the email states them; do not compute nights from dates; ignore weekday names; a date without a year is its next occurrence after today; missing guest counts are 0, or 2 adults per room when only rooms are given; adults and children are totals over all rooms; rooms is 1 unless the email asks for more.
+
+Email:
+{email_body}"""
+# Repair: when an extraction has check-in but no usable check-out, only the sentences that can hold
+# dates go back to the fast model, asking for just the fields that are missing or wrong
+REPAIR_PROMPT_VERSION = "v1"
+REPAIR_TOKEN_BUDGET = int(os.getenv("REPAIR_TOKEN_BUDGET", "120"))
+REPAIR_PROMPT = """A hotel reservation email was read as: {known}. {problem} Today is {today}.
+Using only the sentences below, reply with exactly these lines and nothing else:
+{fields}
+A date without a year is its next occurrence after today; use null when the sentences do not say.
+
+Sentences:
+{sentences}"""
+REPAIR_FIELD_LINES = {
+    'check_in': "Check-in: YYYY-MM-DD or null",
+    'check_out': "Check-out: YYYY-MM-DD or null",
+    'nights': "Nights: number or null",
+}
+STAY_HINT_PATTERN = re.compile(
+    r'\d|night|day|week|check|arriv|depart|stay|until|till|from|'
+    r'νύχτ|νυχτ|βράδ|βραδ|διανυκτ|μέρ|μερ|ημέρ|ημερ|εβδομ|άφιξ|αφιξ|αναχώρ|αναχωρ|έως|εως|μέχρι|μεχρι|από|απο',
+    re.IGNORECASE
+)
+openrouter_breaker = CircuitBreaker("OpenRouter")
+AI_RETRY_BACKOFF_SECONDS = float(os.getenv("AI_RETRY_BACKOFF_SECONDS", "1"))
+openrouter_limiter = rate_limiter(urlparse(OPEN_ROUTER_API_URL).hostname)
+ROUTE_STATS = defaultdict(lambda: {'calls': 0, 'successes': 0, 'failures': 0, 'latency': 0.0})
+_route_stats_local = threading.local()
+
+# Body parts larger than this are truncated before decoding; attachments are never decoded.
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", "262144"))
+# Used for undeclared charsets that are not valid UTF-8, which in practice means Greek Outlook mail
+FALLBACK_CHARSET = os.getenv("FALLBACK_CHARSET", "windows-1253")
+
+# Prompt pruning. Token counts are estimated at four characters per token.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "400"))
+QUOTE_HEADER_PATTERN = re.compile(
+    r'^(On .{0,200} wrote:|Στις .{0,200} έγραψε:|-{2,}\s*(Original Message|Αρχικό μήνυμα)\s*-{2,}|(From|Από|Sent|Στάλθηκε):\s.*)$',
+    re.IGNORECASE
+)
+SIGNATURE_PATTERN = re.compile(r'^(--|__+|Sent from my .*|Στάλθηκε από .*)$', re.IGNORECASE)
+# A sign-off only ends the message near its end; "Thanks," mid-body is usually followed by the actual request
+SIGN_OFF_PATTERN = re.compile(
+    r'^((Best|Kind|Warm)? ?regards,?|Thanks?( you)?,?|Cheers,?|'
+    r'Με (εκτίμηση|τιμή|φιλικούς χαιρετισμούς),?|Φιλικά,?|Ευχαριστώ( πολύ)?,?)$',
+    re.IGNORECASE
+)
+SIGN_OFF_TAIL_LINES = 4
+BOILERPLATE_PATTERN = re.compile(
+    r'confidential|intended recipient|disclaimer|virus|unsubscribe|privacy policy|εμπιστευτικ|αποδέκτ|απόρρητ',
+    re.IGNORECASE
+)
+RESERVATION_HINT_PATTERN = re.compile(
+    r'\d|adult|child|kid|infant|night|room|check|arriv|depart|stay|'
+    r'jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|'
+    r'ενήλ|ενηλ|άτομ|ατομ|παιδ|μωρ|νύχτ|νυχτ|βράδ|βραδ|διανυκτ|δωμάτ|δωματ|άφιξ|αφιξ|αναχώρ|αναχωρ|'
+    r'ιαν|φεβ|μαρτ|απρ|μαΐ|μαι|ιουν|ιουλ|αυγ|σεπτ|οκτ|νοε|δεκ',
+    re.IGNORECASE
+)
+
+# Booking engine scraping. In lean mode we skip everything the price table does not need and
+# wait for the table itself (or the engine's no-availability notice) instead of network idle.
+SCRAPE_LEAN_MODE = os.getenv("SCRAPE_LEAN_MODE", "1") == "1"
+SCRAPE_TIMEOUT_MS = int(os.getenv("SCRAPE_TIMEOUT_MS", "15000"))
+SCRAPE_LAYOUT_GRACE_MS = int(os.getenv("SCRAPE_LAYOUT_GRACE_MS", "5000"))
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_TRACKER_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googleadservices.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "bing.com",
+    "tiktok.com",
+)
+NO_AVAILABILITY_MARKERS = [
+    "no availability",
+    "no rooms available",
+    "not available for the selected dates",
+    "δεν υπάρχει διαθεσιμότητα",
+    "δεν υπάρχουν διαθέσιμα δωμάτια",
+]
+# Resolves to 'rooms', 'empty' or 'changed' once the page settles; returns false while still loading.
+RESULTS_READY_JS = """
+([markers, graceMs]) => {
+    if (document.querySelector('td.price')) return 'rooms';
+    const text = document.body ? document.body.innerText.toLowerCase() : '';
+    if (markers.some(marker => text.includes(marker))) return 'empty';
+    if (document.readyState === 'complete' && performance.now() > graceMs) return 'changed';
+    return false;
+}
+"""
+# Walks name and price cells in document order so every price stays attached to the room row
+# above it, and returns the whole table in a single round-trip.
+ROOM_ROWS_JS = r"""
+() => {
+    const rooms = [];
+    let current = null;
+    for (const cell of document.querySelectorAll('td.name, td.price')) {
+        if (cell.matches('td.name')) {
+            current = {name: cell.innerText.trim(), prices: []};
+            rooms.push(current);
+            continue;
+        }
+        if (!current) continue;
+        const text = cell.innerText.trim();
+        const match = text.match(/([$€£])\s*([\d,]+(?:\.\d{1,2})?)/);
+        // The policy belongs to this price's own rate: its cell, its rate container, or the row when
+        // the row lists this one rate only. A row with several rates never lends its label to all of them.
+        const labelSelector = '.policy, .cancellation, .rate-name';
+        const row = cell.closest('tr');
+        const container = cell.closest('.rate, .rateplan, .rate-plan, [data-rate-id]');
+        let label = cell.querySelector(labelSelector) || (container ? container.querySelector(labelSelector) : null);
+        if (!label && row && row.querySelectorAll('td.price').length === 1) {
+            label = row.querySelector(labelSelector + ', td.rate');
+        }
+        current.prices.push({
+            text: text,
+            symbol: match ? match[1] : null,
+            amount: match ? match[2].replace(/,/g, '') : null,
+            policy: label ? label.innerText.trim() : null,
+        });
+    }
+    return rooms;
+}
+"""
+NON_REFUNDABLE_MARKERS = ("non-refundable", "non refundable", "nonrefundable", "μη επιστρεπτ")
+FREE_CANCELLATION_MARKERS = ("free cancellation", "refundable", "δωρεάν ακύρωση", "δωρεαν ακυρωση")
+CURRENCY_SYMBOLS = {'EUR': '€', 'USD': '$'}
+# Identical availability queries within this window share one scrape
+SCRAPE_RESULT_TTL_SECONDS = int(os.getenv("SCRAPE_RESULT_TTL_SECONDS", "600"))
+# Refresh stale availability grid cells on a background thread for the length of a run. A full pass is hundreds of
+# scrapes, so it is off by default; it gets its own breaker and a share of the booking engine's rate limit.
+GRID_PREFETCH = os.getenv("GRID_PREFETCH", "0") == "1"
+PREFETCH_RATE_SHARE = float(os.getenv("PREFETCH_RATE_SHARE", "0.25"))
+PREFETCH_STOP_TIMEOUT_SECONDS = float(os.getenv("PREFETCH_STOP_TIMEOUT_SECONDS", "60"))
+booking_engine_breaker = CircuitBreaker("reserve-online.net")
+BOOKING_ENGINE_URL = "https://thekokoonvolos.reserve-online.net/"
+booking_engine_limiter = rate_limiter(urlparse(BOOKING_ENGINE_URL).hostname)
+prefetch_breaker = CircuitBreaker("reserve-online.net prefetch")
+prefetch_limiter = booking_engine_limiter.share("reserve-online.net prefetch", PREFETCH_RATE_SHARE) if booking_engine_limiter else None
+# Browser warm start, in order of preference: attach to a long-lived local Chromium over CDP, reuse a
+# persistent profile directory, or launch fresh but restore cookies and session from a storage_state file
+BROWSER_CDP_URL = os.getenv("BROWSER_CDP_URL", "")
+BROWSER_USER_DATA_DIR = os.getenv("BROWSER_USER_DATA_DIR", "")
+BROWSER_STORAGE_STATE_PATH = os.getenv("BROWSER_STORAGE_STATE_PATH", "browser_state.json")
+SMTP_TIMEOUT_SECONDS = 30
+# Staff notifications are the fallback for every failure, so they get this long even after the deadline
+SMTP_MIN_TIMEOUT_SECONDS = 10
 
 def get_staff_email():
     staff_email = os.environ['STAFF_EMAIL']
     logger.info(f"Retrieved staff email: {staff_email}")
     return staff_email
 
-def detect_language(text: str) -> str:
-    lang = transliterate_detect_language(text)
-    logger.info(f"Detected language: {'Greek' if lang == 'el' else 'English'}")
-    return 'el' if lang == 'el' else 'en'
-
 def clean_email_body(email_body: str) -> str:
     logger.info("Cleaning email body")
     email_body = re.sub(r'---------- Forwarded message ---------\n.*?\n\n', '', email_body, flags=re.DOTALL)
     email_body = re.sub(r'^(From|Date|Subject|To):.*$', '', email_body, flags=re.MULTILINE)
-    email_body = re.sub(r'^[A-Za-z-]+:\s.*$', '', email_body, flags=re.MULTILINE)
+    email_body = re.sub(r'^(Cc|Bcc|Sent|Reply-To|Message-ID|MIME-Version|Content-Type|X-[A-Za-z-]+):\s.*$', '', email_body, flags=re.MULTILINE)
     email_body = re.sub(r'\n\s*\n', '\n\n', email_body)
     email_body = email_body.strip()
     logger.info(f"Cleaned email body (first 100 chars): {email_body[:100]}...")
     return email_body
     
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def is_near_end(lines: List[str], index: int) -> bool:
+    """Whether at most SIGN_OFF_TAIL_LINES non-blank lines follow, stopping at quoted history."""
+    following = 0
+    for line in lines[index + 1:]:
+        if QUOTE_HEADER_PATTERN.match(line) or line.startswith('>') or SIGNATURE_PATTERN.match(line):
+            break
+        if line:
+            following += 1
+    return following <= SIGN_OFF_TAIL_LINES
+
+def prune_email_body(email_body: str, token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Drop quoted history, signatures and boilerplate, then fit the rest into the token budget."""
+    tokens_before = estimate_tokens(email_body)
+    kept = []
+    lines = [re.sub(r'<[^>\n]{1,200}>', '', line).strip() for line in email_body.splitlines()]
+    for i, line in enumerate(lines):
+        if QUOTE_HEADER_PATTERN.match(line):
+            break
+        if kept and SIGNATURE_PATTERN.match(line):
+            break
+        if kept and SIGN_OFF_PATTERN.match(line) and is_near_end(lines, i):
+            break
+        if line.startswith('>') or BOILERPLATE_PATTERN.search(line):
+            continue
+        if line or (kept and kept[-1]):
+            kept.append(line)
+    
+    if estimate_tokens('\n'.join(kept)) > token_budget:
+        # Keep lines that look like dates or guest counts first, then fill up in reading order
+        ranked = sorted(range(len(kept)), key=lambda i: (not RESERVATION_HINT_PATTERN.search(kept[i]), i))
+        selected, used = set(), 0
+        for i in ranked:
+            cost = estimate_tokens(kept[i]) + 1
+            if used + cost > token_budget:
+                continue
+            selected.add(i)
+            used += cost
+        kept = [kept[i] for i in sorted(selected)]
+    
+    pruned = '\n'.join(kept).strip()
+    tokens_after = estimate_tokens(pruned)
+    logger.info(f"Pruned email body from ~{tokens_before} to ~{tokens_after} tokens ({tokens_before - tokens_after} saved)")
+    return pruned
+
 def parse_date(date_string: str) -> Optional[date]:
     logger.info(f"[PARSE_DATE] Parsing date string: {date_string}")
     if date_string.lower() in ['null', 'none', 'n/a', '-', '']:
@@ -69,11 +307,12 @@ def parse_date(date_string: str) -> Optional[date]:
         # First, try to parse with a specific format
         parsed_date = datetime.strptime(date_string, "%Y-%m-%d").date()
     except ValueError:
-        # If that fails, use dateparser for more flexible parsing
-        parsed_date = dateparser.parse(date_string)
-        if parsed_date:
+        # Then the compiled date grammar, and dateparser only for text it does not recognise
+        today = reference_today()
+        parsed_date = parse_date_text(date_string) or dateparser.parse(date_string, settings={'RELATIVE_BASE': datetime(today.year, today.month, today.day)})
+        if isinstance(parsed_date, datetime):
             parsed_date = parsed_date.date()
-        else:
+        if not parsed_date:
             logger.error(f"[PARSE_DATE_ERROR] Failed to parse date: {date_string}")
             return None
     
@@ -361,6 +600,19 @@ def parse_children(content: str) -> int:
     logger.error("[PARSE_CHILDREN_ERROR] Number of children not found")
     return 0
 
+def parse_rooms(content: str) -> int:
+    patterns = [
+        r'\*\*Rooms:\*\*\s*(\d+)',
+        r'Rooms:\s*(\d+)',
+        r'Number of rooms:\s*(\d+)',
+        r'ΔΩΜΑΤΙΑ:?\s*(\d+)',  # Greek: Rooms
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, content, re.IGNORECASE)
+        if match and int(match.group(1)) > 0:
+            return int(match.group(1))
+    return 1
+
 def parse_room_type(content: str) -> Optional[str]:
     patterns = [
         r'\*\*Room Type:\*\*\s*(.+)',
@@ -480,6 +732,11 @@ def parse_standardized_content(standardized_content: str) -> Dict[str, Any]:
     reservation_info['children'] = children
     logger.info(f"Parsed number of children: {children}")
     
+    # Parse rooms
+    rooms = parse_rooms(standardized_content)
+    reservation_info['rooms'] = rooms
+    logger.info(f"Parsed number of rooms: {rooms}")
+    
     # Parse room type
     room_type = parse_room_type(standardized_content)
     if room_type:
@@ -512,8 +769,8 @@ def parse_standardized_content(standardized_content: str) -> Dict[str, Any]:
     logger.info(f"[PARSE_STANDARDIZED_CONTENT] Final parsed reservation info: {reservation_info}")
     return reservation_info
 
-def send_to_ai_model(prompt: str, max_retries: int = 3) -> str:
-    logger.info("Sending prompt to AI model")
+def send_to_ai_model(prompt: str, max_retries: int = 3, model: Optional[str] = None) -> str:
+    logger.info(f"Sending prompt to AI model {model or '(account default)'}")
     api_key = os.environ.get("OPEN_ROUTER_API_KEY")
     if not api_key:
         logger.error("OPEN_ROUTER_API_KEY is not set in the environment variables")
@@ -532,89 +789,224 @@ def send_to_ai_model(prompt: str, max_retries: int = 3) -> str:
             {"role": "user", "content": prompt}
         ]
     }
-
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Attempt {attempt + 1} to send request to AI model")
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
+    if model:
+        data["model"] = model
+
+    deadline = current_deadline()
+    # The first token is taken before allow(): a caller that runs out of time waiting for it
+    # must not hold the half-open trial slot
+    if openrouter_limiter:
+        openrouter_limiter.acquire(deadline)
+    # One breaker outcome per call, not per attempt, so the retries for a single email cannot open it
+    openrouter_breaker.allow()
+    recorded = False
+    try:
+        last_error: Optional[Exception] = None
+        for attempt in range(max_retries):
+            if attempt:
+                time.sleep(min(AI_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1), max(deadline.remaining(), 0)))
+                if openrouter_limiter:
+                    openrouter_limiter.acquire(deadline)
+            try:
+                logger.info(f"Attempt {attempt + 1} to send request to AI model")
+                response = requests.post(
+                    OPEN_ROUTER_API_URL,
+                    headers=headers,
+                    json=data,
+                    timeout=deadline.timeout(30)
+                )
+                response.raise_for_status()
+                # A 200 can still carry an error body without choices
+                content = response.json()['choices'][0]['message']['content'].strip()
+            except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as e:
+                last_error = e
+                logger.error(f"Attempt {attempt + 1} failed: Error in AI model communication: {type(e).__name__}: {e}")
+                continue
+            openrouter_breaker.record_success()
+            recorded = True
             logger.info("Successfully received response from AI model")
-            return result['choices'][0]['message']['content'].strip()
-        except requests.RequestException as e:
-            logger.error(f"Attempt {attempt + 1} failed: Error in AI model communication: {str(e)}")
-            if attempt == max_retries - 1:
-                raise
-
-    logger.error("Max retries reached for AI model communication")
-    raise Exception("Max retries reached for AI model communication")
+            return content
+
+        if last_error is None:
+            # No request was sent, so there is no outcome to record; the finally block frees the trial slot
+            raise RuntimeError(f"No request sent to AI model (max_retries={max_retries})")
+        openrouter_breaker.record_failure()
+        recorded = True
+        logger.error("Max retries reached for AI model communication")
+        raise last_error
+    finally:
+        if not recorded:
+            openrouter_breaker.release()
     
 
 def calculate_nights(check_in: date, check_out: date) -> int:
     """Calculate the number of nights between  and check-out dates."""
     return (check_out - check_in).days
 
-def transform_to_standard_format(email_body: str) -> str:
-    logger.info("Transforming email content to standard format")
-    current_date = datetime.now().date()
-    current_year = current_date.year
-    prompt = f"""
-    Transform the following email content into a standardized format:
-    
-    Original Email:
-    {email_body}
-    
-    Standardized Format:
-    Check-in: [DATE or null]
-    Check-out: [DATE or null]
-    Nights: [NUMBER or null]
-    Days: [NUMBER or null]
-    Adults: [NUMBER]
-    Children: [NUMBER]
-    Room Type: [TYPE or null]
-    
-    Please follow these guidelines carefully:
-    1. Fill in the [PLACEHOLDERS] with the appropriate information from the email.
-    2. For Check-out and Check-in, use [DATE] if explicitly mentioned such as till 14/10/2024 or october 14 (- transform it to numeric, otherwise use 'null'.
-    3. For nights:
-       - Use [NUMBER] if explicitly mentioned in the email.
-       - Use 'null' if not mentioned and cannot be directly inferred from the email content.
-       - Do NOT calculate nights based on  and check-out dates.
-    4. For dates, use the format YYYY-MM-DD.
-    5. If the year is not specified, assume the current year unless it is after december 31st, in which case use the next year.
-    6. For adults and children, use the numbers mentioned. If not specified, use 0.
-    7. If room type is not specified, use 'null'.
-    8. IMPORTANT: Ignore days of the week (e.g., Monday, Tuesday) when determining dates. Focus only on the numeric date information.
-    10. For Days:
-       - Use [NUMBER] if explicitly mentioned in the email such as staying for three days.
-       - Use 'null' if not mentioned and cannot be directly inferred from the email content.
-       - Do NOT calculate days based on  and check-out dates.
-    11. If no number of Guests,adults kids excetra is mentioned assume it is equal to twice the number of rooms,
-    
-    Current date for reference: {current_date.strftime("%Y-%m-%d")}
-
-    Please provide your standardized output, followed by a brief explanation of how you interpreted the information and any assumptions you made.
-    """
+def transform_to_standard_format(email_body: str, model: Optional[str] = None) -> str:
+    logger.info(f"Transforming email content to standard format with prompt {EXTRACTION_PROMPT_VERSION}")
+    prompt = EXTRACTION_PROMPT.format(today=reference_today().strftime("%Y-%m-%d"), email_body=email_body)
     
     try:
-        transformed_content = send_to_ai_model(prompt)
+        transformed_content = send_to_ai_model(prompt, model=model)
         logger.info(f"Standardized content: {transformed_content}")
         return transformed_content
     except Exception as e:
         logger.error(f"Error during email transformation: {str(e)}")
         raise
 
-def process_email_content(email_body: str) -> Dict[str, Any]:
-    logger.info("Processing email content")
+def validate_extraction(reservation_info: Dict[str, Any]) -> Optional[str]:
+    """Return why an extraction should be escalated, or None when it is usable."""
+    if 'error' in reservation_info:
+        return reservation_info['error']
+    if not isinstance(reservation_info.get('check_in'), date):
+        return "Missing check-in date"
+    return None
+
+@contextmanager
+def route_stats_scope():
+    """Count this thread's extraction routes in a private table, so evaluation and shadow runs stay out of ROUTE_STATS."""
+    previous = getattr(_route_stats_local, 'stats', None)
+    _route_stats_local.stats = defaultdict(lambda: {'calls': 0, 'successes': 0, 'failures': 0, 'latency': 0.0})
+    try:
+        yield _route_stats_local.stats
+    finally:
+        _route_stats_local.stats = previous
+
+def record_route(route: str, latency: float, success: bool) -> None:
+    local_stats = getattr(_route_stats_local, 'stats', None)
+    stats = (ROUTE_STATS if local_stats is None else local_stats)[route]
+    stats['calls'] += 1
+    stats['successes' if success else 'failures'] += 1
+    stats['latency'] += latency
+
+def log_route_stats() -> None:
+    for route, stats in ROUTE_STATS.items():
+        average = stats['latency'] / stats['calls'] if stats['calls'] else 0.0
+        logger.info(f"Extraction route {route}: {stats['calls']} calls, {stats['successes']} valid, {stats['failures']} escalated or failed, {average:.2f}s average latency")
+
+def extract_offline_reservation_info(email_body: str) -> Optional[Dict[str, Any]]:
+    """The offline tier: only a complete stay with a stated number of adults is trusted without a model."""
+    started = time.perf_counter()
+    reservation_info = extract_offline(email_body)
+    if not all(key in reservation_info for key in ('check_in', 'check_out', 'adults')):
+        record_route('offline', time.perf_counter() - started, False)
+        return None
+    reservation_info.setdefault('children', 0)
+    reservation_info['total_guests'] = reservation_info['adults'] + reservation_info['children']
+    reservation_info = post_process_reservation_info(reservation_info)
+    reason = validate_extraction(reservation_info)
+    record_route('offline', time.perf_counter() - started, reason is None)
+    if reason is not None:
+        return None
+    reservation_info['extraction_source'] = 'offline'
+    logger.info(f"Resolved reservation offline: {reservation_info}")
+    return reservation_info
+
+def fields_to_repair(reservation_info: Dict[str, Any]) -> List[str]:
+    """Fields worth a targeted re-ask: a check-in without any check-out, or a check-out that is not after it."""
+    if not isinstance(reservation_info.get('check_in'), date):
+        return []
+    if reservation_info.get('error', '').startswith("Invalid date range"):
+        return ['check_in', 'check_out']
+    if 'error' not in reservation_info and reservation_info.get('check_out') is None:
+        return ['check_out', 'nights']
+    return []
+
+def stay_sentences(email_body: str, token_budget: int = REPAIR_TOKEN_BUDGET) -> str:
+    """The sentences that can say when the stay starts or ends, in reading order, within the budget."""
+    sentences = [sentence.strip() for sentence in re.split(r'(?<=[.!?;])\s+|\n+', email_body) if STAY_HINT_PATTERN.search(sentence)]
+    kept, used = [], 0
+    for sentence in sentences:
+        cost = estimate_tokens(sentence) + 1
+        if used + cost > token_budget:
+            continue
+        kept.append(sentence)
+        used += cost
+    return '\n'.join(kept)
+
+def repair_reservation_info(email_body: str, reservation_info: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Re-ask the fast model for the given fields only and merge its answer; the original is kept if that fails."""
+    sentences = stay_sentences(email_body)
+    if not sentences:
+        return reservation_info
+    if 'check_in' in fields:
+        problem = "Its check-out date is not after its check-in date."
+    else:
+        problem = "Its check-out date and number of nights are missing."
+    known = ", ".join(f"{key} {reservation_info[key]}" for key in ('check_in', 'check_out', 'adults', 'children') if reservation_info.get(key) is not None)
+    prompt = REPAIR_PROMPT.format(
+        known=known, problem=problem, today=reference_today().strftime("%Y-%m-%d"),
+        fields="\n".join(REPAIR_FIELD_LINES[field] for field in fields), sentences=sentences,
+    )
+    logger.info(f"Repairing {', '.join(fields)} with prompt {REPAIR_PROMPT_VERSION} (~{estimate_tokens(prompt)} tokens)")
+    started = time.perf_counter()
     try:
-        standardized_content = transform_to_standard_format(email_body)
+        answer = send_to_ai_model(prompt, model=EXTRACTION_ROUTES[0][1])
+    except Exception as e:
+        record_route('repair', time.perf_counter() - started, False)
+        logger.warning(f"Repair of {', '.join(fields)} failed ({e}), keeping the original extraction")
+        return reservation_info
+
+    parsers = {'check_in': parse_check_in, 'check_out': parse_check_out, 'nights': parse_nights}
+    repaired = {key: value for key, value in reservation_info.items() if key not in fields and key not in ('check_out', 'nights', 'error')}
+    for field in fields:
+        value = parsers[field](answer)
+        if value is not None:
+            repaired[field] = value
+        elif field == 'check_in':
+            repaired[field] = reservation_info['check_in']
+    repaired = post_process_reservation_info(repaired)
+    success = validate_extraction(repaired) is None and repaired.get('check_out') is not None
+    record_route('repair', time.perf_counter() - started, success)
+    if not success:
+        logger.warning(f"Repair did not produce a valid stay ({repaired.get('error', 'no check-out')}), keeping the original extraction")
+        return reservation_info
+    repaired['extraction_source'] = f"{reservation_info['extraction_source']}+repair:{REPAIR_PROMPT_VERSION}"
+    logger.info(f"Repaired reservation info: {repaired}")
+    return repaired
+
+def extract_reservation_info(email_body: str) -> Dict[str, Any]:
+    if OFFLINE_EXTRACTION:
+        reservation_info = extract_offline_reservation_info(email_body)
+        if reservation_info is not None:
+            return reservation_info
+    reservation_info = extract_with_model_routes(email_body)
+    fields = fields_to_repair(reservation_info)
+    if fields:
+        reservation_info = repair_reservation_info(email_body, reservation_info, fields)
+    return reservation_info
+
+def extract_with_model_routes(email_body: str) -> Dict[str, Any]:
+    reservation_info: Dict[str, Any] = {}
+    for i, (route, model) in enumerate(EXTRACTION_ROUTES):
+        is_last_route = i == len(EXTRACTION_ROUTES) - 1
+        started = time.perf_counter()
+        try:
+            standardized_content = transform_to_standard_format(email_body, model=model)
+        except Exception as e:
+            record_route(route, time.perf_counter() - started, False)
+            # Another model behind the same unhealthy endpoint or an exhausted budget will not do better
+            if is_last_route or isinstance(e, (CircuitOpenError, DeadlineExceeded)):
+                raise
+            logger.warning(f"Extraction route {route} failed ({e}), escalating")
+            continue
         reservation_info = parse_standardized_content(standardized_content)
         reservation_info = post_process_reservation_info(reservation_info)
+        reason = validate_extraction(reservation_info)
+        record_route(route, time.perf_counter() - started, reason is None)
+        if reason is None:
+            reservation_info['extraction_source'] = f"llm:{route}:{EXTRACTION_PROMPT_VERSION}"
+            return reservation_info
+        if not is_last_route:
+            logger.warning(f"Extraction route {route} failed validation ({reason}), escalating")
+    reservation_info['extraction_source'] = f"llm:{EXTRACTION_ROUTES[-1][0]}:{EXTRACTION_PROMPT_VERSION}"
+    return reservation_info
+
+def process_email_content(email_body: str) -> Dict[str, Any]:
+    logger.info("Processing email content")
+    try:
+        reservation_info = extract_reservation_info(email_body)
         logger.info(f"Processed email content: {reservation_info}")
         return reservation_info
     except Exception as e:
@@ -654,22 +1046,94 @@ def connect_to_imap(email_address, password, imap_server, imap_port=993):
         logger.error(f"Unexpected error: {type(e).__name__}: {e}")
         raise
 
-def get_email_content(msg):
-    logger.info("Retrieving email content")
-    subject = decode_header(msg["Subject"])[0][0]
-    if isinstance(subject, bytes):
-        subject = subject.decode()
-    
-    if msg.is_multipart():
-        for part in msg.walk():
-            if part.get_content_type() == "text/plain":
-                content = part.get_payload(decode=True).decode()
-                logger.info(f"Retrieved multipart email content (first 100 chars): {content[:100]}...")
-                return content
+class HTMLTextExtractor(HTMLParser):
+    BLOCK_TAGS = {'p', 'div', 'br', 'tr', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'blockquote'}
+    SKIPPED_TAGS = {'script', 'style', 'head', 'title'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+def html_to_text(html: str) -> str:
+    extractor = HTMLTextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    text = re.sub(r'[ \t\r\f\v]+', ' ', ''.join(extractor.parts))
+    return re.sub(r'\n\s*\n+', '\n\n', text).strip()
+
+def parse_email_bytes(raw_email: bytes) -> Message:
+    return BytesParser(policy=policy.default).parsebytes(raw_email)
+
+def read_part_bytes(part: Message, limit: int = MAX_BODY_BYTES) -> bytes:
+    encoded = part.get_payload()
+    if not isinstance(encoded, str):
+        return b''
+    if len(encoded) <= limit * 2:
+        return (part.get_payload(decode=True) or b'')[:limit]
+    
+    # Oversized part: decode only the leading slice instead of the whole payload
+    logger.warning(f"Truncating oversized {part.get_content_type()} part ({len(encoded)} encoded bytes)")
+    head = encoded[:limit * 2]
+    transfer_encoding = str(part.get('Content-Transfer-Encoding', '7bit')).strip().lower()
+    if transfer_encoding == 'base64':
+        head = ''.join(head.split())
+        return base64.b64decode(head[:len(head) // 4 * 4])[:limit]
+    if transfer_encoding == 'quoted-printable':
+        return quopri.decodestring(head.encode('ascii', 'replace'))[:limit]
+    return head.encode('ascii', 'surrogateescape')[:limit]
+
+def decode_text_part(part: Message) -> str:
+    payload = read_part_bytes(part)
+    charset = part.get_content_charset()
+    if charset:
+        try:
+            return payload.decode(codecs.lookup(charset).name, errors='replace')
+        except LookupError:
+            logger.warning(f"Unknown charset {charset}, guessing instead")
+    try:
+        return payload.decode('utf-8')
+    except UnicodeDecodeError:
+        return payload.decode(FALLBACK_CHARSET, errors='replace')
+
+def get_email_content(msg: Message) -> str:
+    logger.info(f"Retrieving email content for: {msg.get('Subject', '')}")
+    plain_part = html_part = None
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain' and plain_part is None:
+            plain_part = part
+        elif content_type == 'text/html' and html_part is None:
+            html_part = part
+    
+    if plain_part is not None:
+        content = decode_text_part(plain_part)
+    elif html_part is not None:
+        logger.info("No text/plain part, converting HTML body to text")
+        content = html_to_text(decode_text_part(html_part))
     else:
-        content = msg.get_payload(decode=True).decode()
-        logger.info(f"Retrieved simple email content (first 100 chars): {content[:100]}...")
-        return content
+        logger.warning("Email has no text body")
+        content = ''
+    logger.info(f"Retrieved email content (first 100 chars): {content[:100]}...")
+    return content
 
 def parse_numeric_fields(reservation_info):
     logger.info("Parsing numeric fields in reservation info")
@@ -688,87 +1152,431 @@ def parse_numeric_fields(reservation_info):
     return reservation_info
 
 def is_greek(text):
-    result = bool(re.search(r'[\u0370-\u03FF]', text))
+    result = normalize(text).is_greek
     logger.info(f"Text language detection: {'Greek' if result else 'Not Greek'}")
     return result
 
-def scrape_thekokoon_availability(check_in, check_out, adults, children):
-    logger.info(f"Scraping availability for : {check_in}, check-out: {check_out}, adults: {adults}, children: {children}")
-    base_url = f"https://thekokoonvolos.reserve-online.net/?checkin={check_in.strftime('%Y-%m-%d')}&rooms=1&nights={(check_out - check_in).days}&adults={adults}&src=107"
-    if children > 0:
-        base_url += f"&children={children}"
+class ScrapeLayoutError(Exception):
+    """Raised when the booking engine page shows neither prices nor a no-availability notice."""
+
+
+def should_block_request(url: str, resource_type: str) -> bool:
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = urlparse(url).hostname or ''
+    return any(host == tracker or host.endswith('.' + tracker) for tracker in BLOCKED_TRACKER_HOSTS)
+
+def block_heavy_resources(route) -> None:
+    request = route.request
+    if should_block_request(request.url, request.resource_type):
+        route.abort()
+    else:
+        route.continue_()
+
+def wait_for_results(page, timeout_ms: float = SCRAPE_TIMEOUT_MS) -> str:
+    logger.info("Waiting for room prices or a no-availability marker")
+    try:
+        handle = page.wait_for_function(
+            RESULTS_READY_JS,
+            arg=[NO_AVAILABILITY_MARKERS, SCRAPE_LAYOUT_GRACE_MS],
+            timeout=timeout_ms,
+        )
+    except PlaywrightTimeoutError:
+        raise ScrapeLayoutError(f"No prices or availability marker after {timeout_ms:.0f} ms")
+    state = handle.json_value()
+    if state == 'changed':
+        raise ScrapeLayoutError("Page finished loading without prices or a no-availability marker")
+    logger.info(f"Booking engine page ready: {state}")
+    return state
+
+def classify_cancellation_policy(label: Optional[str], position: int) -> str:
+    label = (label or '').lower()
+    if any(marker in label for marker in NON_REFUNDABLE_MARKERS):
+        return "Non-refundable"
+    if any(marker in label for marker in FREE_CANCELLATION_MARKERS):
+        return "Free Cancellation"
+    # The engine lists the non-refundable rate first when the rate carries no label
+    return "Non-refundable" if position == 0 else "Free Cancellation"
+
+def extract_room_rows(page, currency: str, check_in: date) -> List[Dict[str, Any]]:
+    logger.info("Extracting room rows")
+    rows = page.evaluate(ROOM_ROWS_JS)
+    logger.info(f"Found {len(rows)} room rows")
+    
+    availability_data = []
+    for row in rows:
+        prices = []
+        for price_cell in row['prices']:
+            if price_cell['amount'] is None:
+                continue
+            if price_cell['symbol'] != CURRENCY_SYMBOLS.get(currency, price_cell['symbol']):
+                logger.warning(f"Price {price_cell['text']} for {row['name']} is not in {currency}")
+            policy = classify_cancellation_policy(price_cell['policy'], len(prices))
+            prices.append({
+                f"price_{currency.lower()}": float(price_cell['amount']),
+                "cancellation_policy": policy,
+                "free_cancellation_date": calculate_free_cancellation_date(check_in) if policy == "Free Cancellation" else None
+            })
+        
+        availability_data.append({
+            "room_type": row['name'],
+            "prices": prices,
+            "availability": "Available" if prices else "Not Available"
+        })
+        logger.info(f"Scraped data for room: {row['name']}")
+        for price in prices:
+            logger.info(f"  {price['cancellation_policy']} Price: {price[f'price_{currency.lower()}']:.2f}")
+    return availability_data
+
+# The persistent profile directory and the saved storage state belong to one session at a time: Chromium locks
+# the profile, and two sessions saving the same state file would overwrite each other.
+_profile_lock = threading.Lock()
+_profile_owner: Optional[int] = None
+_browser_profile = threading.local()
+
+def use_ephemeral_browser() -> None:
+    """Give this thread's browser sessions a fresh context instead of the shared profile."""
+    _browser_profile.ephemeral = True
+
+def claim_browser_profile() -> bool:
+    global _profile_owner
+    if getattr(_browser_profile, 'ephemeral', False):
+        return False
+    live_threads = {thread.ident for thread in threading.enumerate()}
+    with _profile_lock:
+        if _profile_owner is None or _profile_owner not in live_threads or _profile_owner == threading.get_ident():
+            _profile_owner = threading.get_ident()
+            return True
+        return False
+
+def release_browser_profile() -> None:
+    global _profile_owner
+    with _profile_lock:
+        if _profile_owner == threading.get_ident():
+            _profile_owner = None
+
+class BrowserSession:
+    """One Playwright browser context kept open for every scrape made by a thread."""
+
+    def __init__(self):
+        self.playwright = sync_playwright().start()
+        self.browser = None
+        self.owns_profile = claim_browser_profile()
+        try:
+            chromium = self.playwright.chromium
+            if BROWSER_CDP_URL:
+                logger.info(f"Connecting to running browser at {BROWSER_CDP_URL}")
+                self.browser = chromium.connect_over_cdp(BROWSER_CDP_URL)
+                # The default context carries the long-lived browser's cookies and HTTP cache
+                self.context = self.browser.contexts[0] if self.browser.contexts else self.browser.new_context()
+            elif BROWSER_USER_DATA_DIR and self.owns_profile:
+                logger.info(f"Launching browser with persistent profile {BROWSER_USER_DATA_DIR}")
+                self.context = chromium.launch_persistent_context(BROWSER_USER_DATA_DIR, headless=True)
+            else:
+                self.browser = chromium.launch(headless=True)
+                storage_state = (BROWSER_STORAGE_STATE_PATH if self.owns_profile and not BROWSER_USER_DATA_DIR and BROWSER_STORAGE_STATE_PATH
+                                 and os.path.exists(BROWSER_STORAGE_STATE_PATH) else None)
+                logger.info(f"Launched browser{' with saved session state' if storage_state else ''}")
+                self.context = self.browser.new_context(storage_state=storage_state)
+        except Exception:
+            if self.owns_profile:
+                release_browser_profile()
+            self.playwright.stop()
+            raise
+        # A persistent context has no browser to ask, so its own close event marks it dead
+        self.context_closed = False
+        self.context.on('close', lambda _: setattr(self, 'context_closed', True))
+
+    def is_alive(self) -> bool:
+        if self.context_closed or (self.browser is not None and not self.browser.is_connected()):
+            return False
+        try:
+            self.context.pages
+        except Exception as e:
+            logger.warning(f"Browser context is unusable: {type(e).__name__}: {e}")
+            return False
+        return True
+
+    def close(self) -> None:
+        try:
+            if self.owns_profile and BROWSER_STORAGE_STATE_PATH and not BROWSER_CDP_URL and not BROWSER_USER_DATA_DIR:
+                self.context.storage_state(path=BROWSER_STORAGE_STATE_PATH)
+            if not BROWSER_CDP_URL:
+                self.context.close()
+            if self.browser is not None:
+                # For a CDP connection this only disconnects and leaves the browser running
+                self.browser.close()
+        except Exception as e:
+            logger.error(f"Error while closing browser session: {type(e).__name__}: {e}")
+        finally:
+            if self.owns_profile:
+                release_browser_profile()
+            self.playwright.stop()
+
+# Every open session by owning thread id. Playwright objects only work on the thread that made them,
+# so each thread closes its own session and shutdown reports any that are still open.
+_browser_sessions: Dict[int, BrowserSession] = {}
+_browser_sessions_lock = threading.Lock()
+
+def get_browser_session() -> BrowserSession:
+    thread_id = threading.get_ident()
+    with _browser_sessions_lock:
+        session = _browser_sessions.get(thread_id)
+    if session is not None and not session.is_alive():
+        logger.warning("Browser session disconnected, starting a new one")
+        close_browser_session()
+        session = None
+    if session is None:
+        session = BrowserSession()
+        with _browser_sessions_lock:
+            _browser_sessions[thread_id] = session
+    return session
+
+def close_browser_session() -> None:
+    with _browser_sessions_lock:
+        session = _browser_sessions.pop(threading.get_ident(), None)
+    if session is not None:
+        session.close()
+
+def close_all_browser_sessions() -> None:
+    """Close this thread's session and sessions left behind by finished threads; warn about the rest."""
+    close_browser_session()
+    live_threads = {thread.ident for thread in threading.enumerate()}
+    with _browser_sessions_lock:
+        leftover = list(_browser_sessions.items())
+    for thread_id, session in leftover:
+        if thread_id in live_threads:
+            logger.warning(f"Browser session of running thread {thread_id} is still open")
+            continue
+        with _browser_sessions_lock:
+            _browser_sessions.pop(thread_id, None)
+        try:
+            session.close()
+        except Exception as e:
+            logger.error(f"Could not close browser session of finished thread {thread_id}: {type(e).__name__}: {e}")
+
+def prefetch_availability(check_in: date, check_out: date, adults: int, children: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Scrape for the grid prefetcher, which browses in its own context and leaves the profile to live scrapes."""
+    use_ephemeral_browser()
+    return scrape_thekokoon_availability(check_in, check_out, adults, children, breaker=prefetch_breaker, limiter=prefetch_limiter)
+
+def split_occupancy(adults: int, children: int, rooms: int) -> Tuple[Tuple[int, int], ...]:
+    """Spread a party over rooms as evenly as possible, with at least one adult in every room."""
+    rooms = max(1, min(rooms, adults))
+    return tuple(
+        (adults // rooms + (i < adults % rooms), children // rooms + (i < children % rooms))
+        for i in range(rooms)
+    )
+
+def room_occupancy(reservation_info: Dict[str, Any]) -> Optional[Tuple[Tuple[int, int], ...]]:
+    """Per-room (adults, children) for multi-room requests; None when one room holds the whole party."""
+    occupancy = reservation_info.get('room_occupancy')
+    if occupancy:
+        occupancy = tuple(tuple(room) for room in occupancy)
+    else:
+        occupancy = split_occupancy(reservation_info.get('adults', 2), reservation_info.get('children', 0), reservation_info.get('rooms', 1) or 1)
+    return occupancy if len(occupancy) > 1 else None
+
+def booking_engine_url(check_in: date, check_out: date, occupancy: Tuple[Tuple[int, int], ...]) -> str:
+    """One booking-engine query for every room; rooms after the first take numbered adultsN/childrenN parameters."""
+    url = f"{BOOKING_ENGINE_URL}?checkin={check_in.strftime('%Y-%m-%d')}&rooms={len(occupancy)}&nights={(check_out - check_in).days}"
+    for number, (adults, children) in enumerate(occupancy, 1):
+        suffix = '' if number == 1 else str(number)
+        url += f"&adults{suffix}={adults}"
+        if children > 0:
+            url += f"&children{suffix}={children}"
+    return url + "&src=107"
+
+def scrape_thekokoon_availability(check_in, check_out, adults, children, lean: bool = SCRAPE_LEAN_MODE, occupancy=None,
+                                  breaker: Optional[CircuitBreaker] = None, limiter: Optional[RateLimiter] = None):
+    breaker = breaker or booking_engine_breaker
+    limiter = limiter or booking_engine_limiter
+    occupancy = occupancy or ((adults, children),)
+    logger.info(f"Scraping availability for : {check_in}, check-out: {check_out}, adults: {adults}, children: {children}, rooms: {len(occupancy)}")
+    base_url = booking_engine_url(check_in, check_out, occupancy)
     
     currencies = ['EUR', 'USD']
     all_availability_data = {}
-    
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
+    failed = False
+    deadline = current_deadline()
+    # As for OpenRouter, the first page load's token is taken before the breaker hands out a trial
+    if limiter:
+        limiter.acquire(deadline)
+    breaker.allow()
+    recorded = False
+    try:
         
-        for currency in currencies:
-            url = f"{base_url}&currency={currency}"
-            logger.info(f"Attempting to scrape availability data for {currency} from {url}")
-            
-            try:
-                page = browser.new_page()
-                page.set_default_timeout(60000)  # Increase timeout to 60 seconds
-                
-                logger.info(f"Navigating to {url}")
-                response = page.goto(url)
-                logger.info(f"Navigation complete. Status: {response.status}")
-                
-                logger.info("Waiting for page to load completely")
-                page.wait_for_load_state('networkidle')
-                
-                logger.info("Checking for room name and price elements")
-                room_names = page.query_selector_all('td.name')
-                room_prices = page.query_selector_all('td.price')
-                
-                logger.info(f"Found {len(room_names)} room names and {len(room_prices)} room prices")
-                
-                availability_data = []
-                for i in range(len(room_names)):
+        context = get_browser_session().context
+        if lean:
+            context.route("**/*", block_heavy_resources)
+        
+        try:
+            for currency in currencies:
+                url = f"{base_url}&currency={currency}"
+                logger.info(f"Attempting to scrape availability data for {currency} from {url}")
+                if deadline.expired():
+                    logger.warning(f"Per-email deadline reached, skipping {currency} and remaining currencies")
+                    break
+                if limiter and currency != currencies[0]:
                     try:
-                        room_type = room_names[i].inner_text().strip()
-                        price_texts = [price.inner_text().strip() for price in room_prices[i*2:i*2+2] if i*2+2 <= len(room_prices)]
-                        
-                        prices = []
-                        for price_text in price_texts:
-                            price_match = re.search(r'([\$€])([\d,]+(?:\.\d{2})?)', price_text)
-                            if price_match:
-                                price = float(price_match.group(2).replace(',', ''))
-                                prices.append({
-                                    f"price_{currency.lower()}": price,
-                                    "cancellation_policy": "Non-refundable" if len(prices) == 0 else "Free Cancellation",
-                                    "free_cancellation_date": calculate_free_cancellation_date(check_in) if len(prices) > 0 else None
-                                })
-                        
-                        room_data = {
-                            "room_type": room_type,
-                            "prices": prices,
-                            "availability": "Available" if prices else "Not Available"
-                        }
-                        
-                        availability_data.append(room_data)
-                        logger.info(f"Scraped data for room: {room_type}")
-                        for price in prices:
-                            logger.info(f"  {price['cancellation_policy']} Price: {price[f'price_{currency.lower()}']:.2f}")
-                    except Exception as e:
-                        logger.error(f"Error processing room {i + 1}:")
-                        logger.error(str(e))
+                        limiter.acquire(deadline)
+                    except DeadlineExceeded as e:
+                        logger.warning(f"{e}, skipping {currency} and remaining currencies")
+                        break
+                timeout_ms = deadline.timeout(SCRAPE_TIMEOUT_MS / 1000 if lean else 60) * 1000
                 
-                all_availability_data[currency] = availability_data
-                logger.info(f"Scraped availability data for {currency}: {availability_data}")
-                
-            except PlaywrightTimeoutError as e:
-                logger.error(f"Timeout error for {currency}: {e}")
-            except Exception as e:
-                logger.error(f"Unexpected error for {currency}: {type(e).__name__}: {e}")
-            finally:
-                page.close()
+                page = None
+                try:
+                    page = context.new_page()
+                    page.set_default_timeout(timeout_ms)
+                    
+                    logger.info(f"Navigating to {url}")
+                    response = page.goto(url, wait_until='domcontentloaded' if lean else 'load')
+                    if response is None or response.status >= 400:
+                        logger.error(f"Booking engine returned {response.status if response else 'no response'} for {currency}, skipping remaining currencies")
+                        failed = True
+                        break
+                    logger.info(f"Navigation complete. Status: {response.status}")
+                    
+                    if lean:
+                        if wait_for_results(page, timeout_ms) == 'empty':
+                            logger.info("Booking engine reports no availability, skipping remaining currencies")
+                            all_availability_data[currency] = []
+                            break
+                    else:
+                        logger.info("Waiting for page to load completely")
+                        page.wait_for_load_state('networkidle')
+                    
+                    availability_data = extract_room_rows(page, currency, check_in)
+                    all_availability_data[currency] = availability_data
+                    logger.info(f"Scraped availability data for {currency}: {availability_data}")
+                    
+                except ScrapeLayoutError as e:
+                    logger.error(f"Unexpected booking engine page for {currency}, skipping remaining currencies: {e}")
+                    failed = True
+                    break
+                except PlaywrightTimeoutError as e:
+                    logger.error(f"Timeout error for {currency}: {e}")
+                    failed = True
+                except Exception as e:
+                    logger.error(f"Unexpected error for {currency}: {type(e).__name__}: {e}")
+                    failed = True
+                finally:
+                    if page:
+                        page.close()
+        finally:
+            if lean:
+                context.unroute("**/*", block_heavy_resources)
+        
+        if all_availability_data:
+            breaker.record_success()
+            recorded = True
+        elif failed:
+            breaker.record_failure()
+            recorded = True
+        return all_availability_data
+    finally:
+        if not recorded:
+            breaker.release()
+
+class SingleFlight:
+    """Run one call per key at a time, hand its result to every concurrent caller and reuse it until it expires."""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.in_flight: Dict[Any, Dict[str, Any]] = {}
+        self.results: Dict[Any, Any] = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            cached = self.results.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl_seconds:
+                logger.info(f"Reusing recent result for {key}")
+                return cached[1]
+            call = self.in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self.in_flight[key] = call
         
-        browser.close()
+        if not is_leader:
+            logger.info(f"Waiting for in-flight call for {key}")
+            # A follower gives up at its own deadline; the leader's scrape may run on a longer budget
+            remaining = current_deadline().remaining()
+            if not call['done'].wait(None if remaining == float('inf') else max(remaining, 0)):
+                raise DeadlineExceeded(f"Per-email deadline exceeded waiting for in-flight call for {key}")
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                now = time.monotonic()
+                # Drop expired results here so a long-running process does not keep one per key ever seen
+                self.results = {k: v for k, v in self.results.items() if now - v[0] < self.ttl_seconds}
+                # Empty results mean the scrape failed, so the next caller should try again
+                if call['error'] is None and call['result']:
+                    self.results[key] = (now, call['result'])
+            call['done'].set()
+        return call['result']
+
+scrape_flight = SingleFlight(SCRAPE_RESULT_TTL_SECONDS)
+
+def get_availability(check_in: date, check_out: date, adults: int, children: int,
+                     occupancy: Optional[Tuple[Tuple[int, int], ...]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    nights = (check_out - check_in).days
+    # The grid holds single rooms only (live scrapes plus the prefetcher); multi-room requests always go to the booking engine
+    cached = None
+    if occupancy is None:
+        try:
+            cached = load_grid().lookup(check_in, nights, adults, children, calculate_free_cancellation_date(check_in))
+        except Exception as e:
+            logger.error(f"Availability grid lookup failed: {type(e).__name__}: {e}")
+    if cached is not None:
+        logger.info("Availability answered from availability grid")
+        return cached
     
-    return all_availability_data
+    logger.info("Availability grid miss, scraping live")
+    return scrape_flight.do(
+        (check_in, check_out, adults, children, occupancy),
+        lambda: scrape_and_store(check_in, check_out, adults, children, occupancy)
+    )
+
+def scrape_and_store(check_in: date, check_out: date, adults: int, children: int,
+                     occupancy: Optional[Tuple[Tuple[int, int], ...]] = None) -> Dict[str, List[Dict[str, Any]]]:
+    availability_data = scrape_thekokoon_availability(check_in, check_out, adults, children, occupancy=occupancy)
+    if occupancy is not None:
+        return availability_data
+    try:
+        store_in_grid(check_in, (check_out - check_in).days, adults, children, availability_data)
+    except Exception as e:
+        logger.error(f"Failed to store scrape result in availability grid: {type(e).__name__}: {e}")
+    return availability_data
+
+def has_available_rooms(availability_data: Dict[str, List[Dict[str, Any]]]) -> bool:
+    return any(room['availability'] == "Available" for rooms in availability_data.values() for room in rooms)
+
+def find_alternatives(reservation_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if room_occupancy(reservation_info) is not None:
+        return []
+    try:
+        return find_alternative_stays(
+            load_grid(),
+            reservation_info['check_in'],
+            reservation_info['nights'],
+            reservation_info.get('adults', 2),
+            reservation_info.get('children', 0)
+        )
+    except Exception as e:
+        logger.error(f"Alternative date search failed: {type(e).__name__}: {e}")
+        return []
 
 def send_email(to_address: str, subject: str, body: str) -> None:
     logger.info(f"Sending email to {to_address}")
@@ -784,7 +1592,7 @@ def send_email(to_address: str, subject: str, body: str) -> None:
     message.attach(MIMEText(body, "plain", "utf-8"))
 
     try:
-        with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
+        with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=current_deadline().timeout(SMTP_TIMEOUT_SECONDS, floor=SMTP_MIN_TIMEOUT_SECONDS)) as server:
             server.login(sender_email, password)
             server.send_message(message)
         logger.info(f"Email sent successfully to {to_address}")
@@ -792,7 +1600,7 @@ def send_email(to_address: str, subject: str, body: str) -> None:
         logger.error(f"Failed to send email to {to_address}. Error: {str(e)}")
         raise
 
-def send_autoresponse(staff_email: str, customer_email: str, reservation_info: Dict[str, Any], availability_data: Dict[str, List[Dict[str, Any]]], is_greek_email: bool, original_email) -> None:
+def send_autoresponse(staff_email: str, customer_email: str, reservation_info: Dict[str, Any], availability_data: Dict[str, List[Dict[str, Any]]], is_greek_email: bool, original_email, alternatives: Optional[List[Dict[str, Any]]] = None) -> None:
     logger.info(f"Sending autoresponse to staff email: {staff_email}")
     if is_greek_email:
         subject = f"Νέο Αίτημα Κράτησης - {customer_email}"
@@ -805,6 +1613,7 @@ def send_autoresponse(staff_email: str, customer_email: str, reservation_info: D
         Αριθμός διανυκτερεύσεων: {reservation_info.get('nights', 'Δεν διευκρινίστηκε')}
         Αριθμός ενηλίκων: {reservation_info['adults']}
         Αριθμός παιδιών: {reservation_info.get('children', 'Δεν διευκρινίστηκε')}
+        Αριθμός δωματίων: {reservation_info.get('rooms', 1)}
 
         Διαθέσιμες επιλογές:
         """
@@ -819,27 +1628,39 @@ def send_autoresponse(staff_email: str, customer_email: str, reservation_info: D
         Number of nights: {reservation_info.get('nights', 'Not specified')}
         Number of adults: {reservation_info['adults']}
         Number of children: {reservation_info.get('children', 'Not specified')}
+        Number of rooms: {reservation_info.get('rooms', 1)}
 
         Available options:
         """
     
+    lines = [body]
     for currency, rooms in availability_data.items():
-        body += f"\nPrices in {currency}:\n"
+        lines.append(f"\nPrices in {currency}:")
         for room in rooms:
-            body += f"\nRoom type: {room['room_type']}\n"
-            body += f"Availability: {room['availability']}\n"
+            lines.append(f"\nRoom type: {room['room_type']}")
+            lines.append(f"Availability: {room['availability']}")
             for price_option in room['prices']:
-                body += f"  Price: {price_option[f'price_{currency.lower()}']:.2f} {currency}\n"
-                body += f"  Cancellation policy: {price_option['cancellation_policy']}\n"
+                lines.append(f"  Price: {price_option[f'price_{currency.lower()}']:.2f} {currency}")
+                lines.append(f"  Cancellation policy: {price_option['cancellation_policy']}")
                 if price_option['free_cancellation_date']:
-                    body += f"  Free cancellation until: {price_option['free_cancellation_date'].strftime('%d/%m/%Y')}\n"
+                    lines.append(f"  Free cancellation until: {price_option['free_cancellation_date'].strftime('%d/%m/%Y')}")
     
-    body += "\nPlease process this request and respond to the customer as appropriate."
+    if alternatives:
+        lines.append("\nNearby dates with availability:")
+        for alternative in alternatives:
+            estimate = " (estimated from nightly prices)" if alternative['estimated'] else ""
+            lines.append(f"  {alternative['check_in'].strftime('%d/%m/%Y')} - {alternative['check_out'].strftime('%d/%m/%Y')} ({alternative['nights']} nights): from {alternative['price_eur']:.2f} EUR{estimate}")
+    
+    lines.append("\nPlease process this request and respond to the customer as appropriate.")
+    body = '\n'.join(lines)
     
     logger.info("Autoresponse content prepared")
-    send_email_with_original(staff_email, subject, body, original_email)
+    send_email_with_original(staff_email, subject, body, original_email, reservation_info)
 
-def send_email_with_original(to_address: str, subject: str, body: str, original_email) -> None:
+def send_email_with_original(to_address: str, subject: str, body: str, original_email, reservation_info: Optional[Dict[str, Any]] = None, immediate: bool = False) -> None:
+    if STAFF_DIGEST_MODE and not immediate and not is_urgent(reservation_info):
+        staff_digest.add(subject, body, original_email, reservation_info)
+        return
     logger.info(f"Sending email with original content to {to_address}")
     smtp_server = "mail.kokoonvolos.gr"
     smtp_port = 465  # SSL port
@@ -854,16 +1675,10 @@ def send_email_with_original(to_address: str, subject: str, body: str, original_
 
     # Attach the original email
     message.attach(MIMEText("\n\n--- Original Message ---\n", "plain", "utf-8"))
-    if original_email.is_multipart():
-        for part in original_email.walk():
-            if part.get_content_type() == "text/plain":
-                message.attach(MIMEText(part.get_payload(decode=True).decode(), "plain", "utf-8"))
-                break
-    else:
-        message.attach(MIMEText(original_email.get_payload(decode=True).decode(), "plain", "utf-8"))
+    message.attach(MIMEText(get_email_content(original_email), "plain", "utf-8"))
 
     try:
-        with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
+        with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=current_deadline().timeout(SMTP_TIMEOUT_SECONDS, floor=SMTP_MIN_TIMEOUT_SECONDS)) as server:
             server.login(sender_email, password)
             server.send_message(message)
         logger.info(f"Email with original content sent successfully to {to_address}")
@@ -871,6 +1686,26 @@ def send_email_with_original(to_address: str, subject: str, body: str, original_
         logger.error(f"Failed to send email with original content to {to_address}. Error: {str(e)}")
         raise
 
+# Outcomes that answered the guest; a repeat of anything else is processed again
+DEDUPE_LINKABLE_OUTCOMES = ('available', 'no_availability')
+
+def send_duplicate_notice(staff_email: str, customer_email: str, duplicate: Dict[str, Any], is_greek_email: bool, original_email) -> None:
+    """A repeat of an inquiry already handled is not processed again, but staff still see that it arrived."""
+    logger.info(f"Sending duplicate notice to staff email: {staff_email}")
+    if is_greek_email:
+        subject = f"Επανάληψη Αιτήματος Κράτησης - {customer_email}"
+        body = f"""
+        Ο/Η {customer_email} έστειλε ξανά ένα αίτημα που έχει ήδη επεξεργαστεί (μήνυμα {duplicate['message_id']}, αποτέλεσμα: {duplicate['result']['outcome']}).
+        Δεν στάλθηκε νέα απάντηση διαθεσιμότητας· το αρχικό μήνυμα επισυνάπτεται.
+        """
+    else:
+        subject = f"Repeated Reservation Request - {customer_email}"
+        body = f"""
+        {customer_email} sent again an inquiry that was already processed (message {duplicate['message_id']}, outcome: {duplicate['result']['outcome']}).
+        It was linked to that inquiry and no new availability response was prepared; the original message is attached.
+        """
+    send_email_with_original(staff_email, subject, body, original_email)
+
 def send_partial_info_response(staff_email: str, customer_email: str, reservation_info: Dict[str, Any], is_greek_email: bool, original_email) -> None:
     logger.info(f"Sending partial info response to staff email: {staff_email}")
     if is_greek_email:
@@ -883,6 +1718,7 @@ def send_partial_info_response(staff_email: str, customer_email: str, reservatio
         Ημερομηνία αναχώρησης: {reservation_info['check_out']}
         Αριθμός ενηλίκων: {reservation_info.get('adults', 'Δεν διευκρινίστηκε')}
         Αριθμός παιδιών: {reservation_info.get('children', 'Δεν διευκρινίστηκε')}
+        Αριθμός δωματίων: {reservation_info.get('rooms', 1)}
 
         Παρακαλώ επεξεργαστείτε αυτό το αίτημα χειροκίνητα και επικοινωνήστε με τον πελάτη το συντομότερο δυνατό.
         """
@@ -896,12 +1732,13 @@ def send_partial_info_response(staff_email: str, customer_email: str, reservatio
         Check-out date: {reservation_info['check_out']}
         Number of adults: {reservation_info.get('adults', 'Not specified')}
         Number of children: {reservation_info.get('children', 'Not specified')}
+        Number of rooms: {reservation_info.get('rooms', 1)}
 
         Please process this request manually and contact the customer as soon as possible.
         """
     
     logger.info("Partial info response content prepared")
-    send_email_with_original(staff_email, subject, body, original_email)
+    send_email_with_original(staff_email, subject, body, original_email, reservation_info)
 
 def send_error_notification(email_body: str, reservation_info: Dict[str, Any], original_email) -> None:
     logger.info("Sending error notification")
@@ -919,55 +1756,140 @@ def send_error_notification(email_body: str, reservation_info: Dict[str, Any], o
     Please review this request manually and respond to the customer as appropriate.
     """
     logger.info("Error notification content prepared")
-    send_email_with_original(staff_email, subject, body, original_email)
+    send_email_with_original(staff_email, subject, body, original_email, reservation_info)
 
+def send_staff_digest() -> None:
+    entries = staff_digest.take()
+    if not entries:
+        return
+    staff_email = get_staff_email()
+    logger.info(f"Sending staff digest with {len(entries)} requests to {staff_email}")
+    smtp_server = "mail.kokoonvolos.gr"
+    smtp_port = 465  # SSL port
+    sender_email = os.environ['EMAIL_ADDRESS']
+    password = os.environ['EMAIL_PASSWORD']
+    message = render_digest(entries, sender_email, staff_email)
+
+    try:
+        with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=current_deadline().timeout(SMTP_TIMEOUT_SECONDS, floor=SMTP_MIN_TIMEOUT_SECONDS)) as server:
+            server.login(sender_email, password)
+            server.send_message(message)
+        logger.info("Staff digest sent successfully")
+    except Exception as e:
+        # The messages are already marked as read, so fall back to one notification each rather than lose them
+        logger.error(f"Failed to send staff digest, sending {len(entries)} notifications individually. Error: {str(e)}")
+        for entry in entries:
+            try:
+                send_email_with_original(staff_email, entry['subject'], entry['body'], entry['original_email'], immediate=True)
+            except Exception as e:
+                logger.error(f"Failed to send notification '{entry['subject']}': {str(e)}")
 
-def process_email(email_msg: email.message.Message, sender_address: str) -> None:
+
+def process_email(email_msg: Message, sender_address: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with deadline_scope(EMAIL_DEADLINE_SECONDS):
+        result = process_email_within_deadline(email_msg, sender_address)
+    result.setdefault('timings', {})['total'] = time.perf_counter() - started
+    try:
+        get_reservation_store().record(result)
+    except Exception as e:
+        logger.error(f"Failed to store inquiry result: {type(e).__name__}: {e}")
+    return result
+
+def process_email_within_deadline(email_msg: Message, sender_address: str) -> Dict[str, Any]:
     logger.info(f"Starting to process email from {sender_address}")
     email_body = get_email_content(email_msg)
     staff_email = get_staff_email()
+    result: Dict[str, Any] = {'message_id': email_msg.get('Message-ID', ''), 'sender': sender_address, 'outcome': None, 'reservation_info': {}, 'timings': {}}
     
+    cleaned_body = None
     try:
+        category = triage_email(email_msg, sender_address, email_body)
+        if category != INQUIRY:
+            logger.info(f"Not a reservation inquiry ({category}), skipping extraction and scraping")
+            result['outcome'] = f"skipped:{category}"
+            return result
+        
+        cleaned_body = clean_email_body(email_body)
+        thread_ids = f"{email_msg.get('In-Reply-To', '')} {email_msg.get('References', '')}".split()
+        # A resend after an outage or a failed extraction deserves a fresh attempt, so only answered inquiries are linked
+        duplicate = get_inquiry_index().find_duplicate(cleaned_body, sender_address, thread_ids, outcomes=DEDUPE_LINKABLE_OUTCOMES,
+                                                     message_id=result['message_id'])
+        if duplicate:
+            logger.info(f"Near-duplicate of message {duplicate['message_id']} from {duplicate['sender']}, linking to its result: {duplicate['result']['outcome']}")
+            result.update(outcome='duplicate', duplicate_of=duplicate['message_id'], reservation_info=duplicate['result']['reservation_info'])
+            try:
+                send_duplicate_notice(staff_email, sender_address, duplicate, is_greek(email_body), email_msg)
+            except Exception as e:
+                logger.error(f"Failed to send duplicate notice: {type(e).__name__}: {e}")
+            return result
+        
         logger.info("Processing email content")
-        standardized_content = transform_to_standard_format(email_body)
-        reservation_info = parse_standardized_content(standardized_content)
-        reservation_info = post_process_reservation_info(reservation_info)
+        prompt_body = prune_email_body(cleaned_body)
+        stage_started = time.perf_counter()
+        reservation_info = extract_reservation_info(prompt_body)
+        result['timings']['extract'] = time.perf_counter() - stage_started
+        result['reservation_info'] = reservation_info
         logger.info(f"Processed reservation info: {reservation_info}")
+        submit_shadow(email_body, reservation_info, result['message_id'])
         
         if 'error' in reservation_info:
             logger.error(f"Error in reservation info: {reservation_info['error']}")
             send_error_notification(email_body, reservation_info, email_msg)
-            return
-        
-        if 'check_in' in reservation_info and isinstance(reservation_info['check_in'], date):
+            result['outcome'] = 'error'
+        elif 'check_in' in reservation_info and isinstance(reservation_info['check_in'], date):
             logger.info("Valid check-in data found, proceeding to web scraping")
+            is_greek_email = is_greek(email_body)
             try:
-                availability_data = scrape_thekokoon_availability(
+                stage_started = time.perf_counter()
+                occupancy = room_occupancy(reservation_info)
+                if occupancy:
+                    reservation_info['room_occupancy'] = occupancy
+                availability_data = get_availability(
                     reservation_info['check_in'],
                     reservation_info['check_out'],
                     reservation_info.get('adults', 2),
-                    reservation_info.get('children', 0)
+                    reservation_info.get('children', 0),
+                    occupancy
                 )
+                result['timings']['availability'] = time.perf_counter() - stage_started
+                result['availability'] = availability_data
                 logger.info(f"Web scraping result: {availability_data}")
                 
-                if availability_data:
+                alternatives = []
+                if not has_available_rooms(availability_data):
+                    logger.info("No rooms available for the requested stay, searching nearby dates")
+                    alternatives = find_alternatives(reservation_info)
+                
+                if availability_data or alternatives:
                     logger.info("Availability data found, sending detailed response to staff")
-                    send_autoresponse(staff_email, sender_address, reservation_info, availability_data, is_greek(email_body), email_msg)
+                    send_autoresponse(staff_email, sender_address, reservation_info, availability_data, is_greek_email, email_msg, alternatives)
+                    result['outcome'] = 'available' if has_available_rooms(availability_data) else 'no_availability'
                 else:
                     logger.info("No availability data found, sending partial information response to staff")
-                    send_partial_info_response(staff_email, sender_address, reservation_info, is_greek(email_body), email_msg)
+                    send_partial_info_response(staff_email, sender_address, reservation_info, is_greek_email, email_msg)
+                    result['outcome'] = 'partial_info'
             except Exception as e:
                 logger.error(f"Error during web scraping: {str(e)}")
-                send_partial_info_response(staff_email, sender_address, reservation_info, is_greek(email_body), email_msg)
+                send_partial_info_response(staff_email, sender_address, reservation_info, is_greek_email, email_msg)
+                result['outcome'] = 'partial_info'
         else:
             logger.warning("Failed to parse valid check-in date. Sending error notification to staff.")
             send_error_notification(email_body, reservation_info, email_msg)
+            result['outcome'] = 'error'
     
     except Exception as e:
         logger.error(f"Error during email processing: {str(e)}")
         send_error_notification(email_body, {}, email_msg)
+        result['outcome'] = 'error'
     
+    if cleaned_body is not None:
+        try:
+            get_inquiry_index().add(cleaned_body, result['message_id'], sender_address, result)
+        except Exception as e:
+            logger.error(f"Failed to record inquiry fingerprint: {type(e).__name__}: {e}")
     logger.info("Email processing completed")
+    return result
     
 def main():
     logger.info("Starting email processor script")
@@ -980,34 +1902,79 @@ def main():
     logger.info(f"IMAP Server: {imap_server}")
     logger.info(f"IMAP Port: {imap_port}")
 
+    started = time.monotonic()
+    prefetcher = start_prefetcher(prefetch_availability, budget_seconds=RUN_BUDGET_SECONDS,
+                                   on_exit=close_browser_session) if GRID_PREFETCH else None
     try:
         imap = connect_to_imap(email_address, password, imap_server, imap_port)
         imap.select("INBOX")
+        uidvalidity = (imap.response("UIDVALIDITY")[1] or [b''])[0]
+        checkpoint = BacklogCheckpoint(uidvalidity.decode() if uidvalidity else '')
 
-        _, message_numbers = imap.search(None, "UNSEEN")
-        if not message_numbers[0]:
+        _, message_uids = imap.uid("search", None, "UNSEEN")
+        pending = [uid for uid in message_uids[0].split() if not checkpoint.is_done(uid)]
+        checkpoint.prune(message_uids[0].split())
+        if not pending:
             logger.info("No new messages found.")
         else:
-            for num in message_numbers[0].split():
-                logger.info(f"Processing message number: {num}")
-                _, msg = imap.fetch(num, "(RFC822)")
-                email_msg = email.message_from_bytes(msg[0][1])
-                
-                sender_address = email.utils.parseaddr(email_msg['From'])[1]
-                logger.info(f"Sender: {sender_address}")
-                
-                email_body = get_email_content(email_msg)
-                logger.info("Email body retrieved")
-                
-                process_email(email_msg, sender_address)
-                logger.info(f"Finished processing message number: {num}")
+            logger.info(f"Ranking {len(pending)} unseen messages by urgency")
+            previews = {}
+            for chunk in chunks(pending, 200):
+                _, fetch_data = imap.uid("fetch", b",".join(chunk), PREVIEW_FETCH)
+                previews.update(parse_preview_response(fetch_data))
+            ranked = rank_messages(previews, datetime.now().date())
+            # Messages the preview fetch could not parse still get processed, last
+            ranked += [uid for uid in pending if uid not in previews]
+            
+            remaining = len(ranked)
+            for chunk in chunks(ranked, BACKLOG_CHUNK_SIZE):
+                for uid in chunk:
+                    if time.monotonic() - started > RUN_BUDGET_SECONDS:
+                        break
+                    remaining -= 1
+                    logger.info(f"Processing message UID: {uid}")
+                    _, msg = imap.uid("fetch", uid, "(BODY.PEEK[])")
+                    email_msg = parse_email_bytes(msg[0][1])
+                    
+                    sender_address = email.utils.parseaddr(email_msg['From'])[1]
+                    logger.info(f"Sender: {sender_address}")
+                    
+                    try:
+                        process_email(email_msg, sender_address)
+                    except Exception as e:
+                        logger.error(f"Failed to process message UID {uid}, leaving it unseen: {e}")
+                        logger.error(traceback.format_exc())
+                        continue
+                    imap.uid("store", uid, "+FLAGS", "(\\Seen)")
+                    checkpoint.mark(uid)
+                    logger.info(f"Finished processing message UID: {uid}")
+                checkpoint.save()
+                get_reservation_store().flush()
+                if staff_digest.due():
+                    send_staff_digest()
+            
+            if remaining:
+                logger.warning(f"Run budget of {RUN_BUDGET_SECONDS:.0f}s used up, {remaining} messages left for the next run")
 
         imap.logout()
+        log_route_stats()
+        log_rate_limit_stats()
+        log_triage_counts()
         logger.info("Email processing completed successfully")
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         logger.error(traceback.format_exc())
         raise
+    finally:
+        if prefetcher is not None:
+            stop_event, thread = prefetcher
+            stop_event.set()
+            # The prefetcher closes its own browser session once its current scrape ends
+            thread.join(PREFETCH_STOP_TIMEOUT_SECONDS)
+        shutdown_shadow()
+        send_staff_digest()
+        close_all_browser_sessions()
+        get_reservation_store().close()
 
 if __name__ == "__main__":
     main()
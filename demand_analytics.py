@@ -0,0 +1,157 @@
+import os
+import sys
+import glob
+import json
+import sqlite3
+import argparse
+import logging
+from typing import Dict, Any, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LEAD_TIME_MAX_DAYS = 365
+MAX_GUESTS = 16
+# Outcomes that say nothing about demand: triage skips and repeats of an inquiry already counted
+EXCLUDED_OUTCOMES = ('duplicate', 'replay_error')
+EXCLUDED_OUTCOME_PREFIX = 'skipped:'
+
+
+def to_arrays(check_in: List[Any], check_out: List[Any], nights: List[Any], adults: List[Any], children: List[Any],
+              rooms: List[Any], received: List[Any], outcome: List[Any]) -> Dict[str, np.ndarray]:
+    """Columns of ISO date strings and numbers to typed arrays; rows without a usable stay are dropped."""
+    check_in_days = np.array(check_in, dtype='datetime64[D]')
+    check_out_days = np.array(check_out, dtype='datetime64[D]')
+    # A missing night count falls back to the check-out date
+    nights_arr = np.array(nights, dtype=np.float64)
+    nights_arr = np.where(nights_arr > 0, nights_arr, (check_out_days - check_in_days).astype(np.float64))
+    outcome_arr = np.array(outcome, dtype=object).astype(str)
+    keep = (
+        ~np.isnat(check_in_days)
+        & (nights_arr > 0) & (nights_arr <= LEAD_TIME_MAX_DAYS)
+        & ~np.isin(outcome_arr, EXCLUDED_OUTCOMES)
+        & ~np.char.startswith(outcome_arr, EXCLUDED_OUTCOME_PREFIX)
+    )
+    return {
+        'check_in': check_in_days[keep],
+        'nights': nights_arr[keep].astype(np.int16),
+        'adults': np.clip(np.nan_to_num(np.array(adults, dtype=np.float64), nan=2), 0, MAX_GUESTS - 1)[keep].astype(np.int16),
+        'children': np.clip(np.nan_to_num(np.array(children, dtype=np.float64), nan=0), 0, MAX_GUESTS - 1)[keep].astype(np.int16),
+        # Inquiries from before multi-room support, and extractors that do not report rooms, asked for one
+        'rooms': np.clip(np.nan_to_num(np.array(rooms, dtype=np.float64), nan=1), 1, MAX_GUESTS)[keep].astype(np.int16),
+        'received': np.array(received, dtype='datetime64[D]')[keep],
+        'outcome': outcome_arr[keep],
+    }
+
+def load_store(path: str) -> Dict[str, np.ndarray]:
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute(
+            "SELECT check_in, check_out, json_extract(reservation_info, '$.nights'), adults, children, "
+            "json_extract(reservation_info, '$.rooms'), date(processed_at, 'unixepoch'), outcome "
+            "FROM inquiries WHERE check_in IS NOT NULL"
+        ).fetchall()
+    finally:
+        connection.close()
+    logger.info(f"Loaded {len(rows)} inquiries from {path}")
+    return to_arrays(*(list(column) for column in zip(*rows))) if rows else to_arrays([], [], [], [], [], [], [], [])
+
+def load_backfill(output_dir: str) -> Dict[str, np.ndarray]:
+    columns: Dict[str, List[Any]] = {key: [] for key in ('check_in', 'check_out', 'nights', 'adults', 'children', 'rooms', 'received', 'outcome')}
+    for path in sorted(glob.glob(os.path.join(output_dir, "chunk-*.jsonl"))):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                row = json.loads(line)
+                for key in columns:
+                    columns[key].append(row.get(key))
+    logger.info(f"Loaded {len(columns['check_in'])} inquiries from {output_dir}")
+    return to_arrays(**columns)
+
+def concatenate(*datasets: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    return {key: np.concatenate([dataset[key] for dataset in datasets]) for key in datasets[0]}
+
+
+def room_nights_per_date(data: Dict[str, np.ndarray]):
+    """Requested room-nights for every calendar date, from a difference array over the stays weighted by rooms."""
+    if not len(data['check_in']):
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64)
+    first = data['check_in'].min()
+    start = (data['check_in'] - first).astype(np.int64)
+    end = start + data['nights']
+    span = int(end.max())
+    rooms = data['rooms']
+    diff = np.bincount(start, weights=rooms, minlength=span + 1) - np.bincount(end, weights=rooms, minlength=span + 1)
+    return first + np.arange(span), np.cumsum(diff)[:span].astype(np.int64)
+
+def lead_times(data: Dict[str, np.ndarray]):
+    """Days between receiving an inquiry and the requested arrival, as a histogram and percentiles."""
+    known = ~np.isnat(data['received'])
+    days = (data['check_in'][known] - data['received'][known]).astype(np.int64)
+    days = days[days >= 0]
+    histogram = np.bincount(np.minimum(days, LEAD_TIME_MAX_DAYS), minlength=LEAD_TIME_MAX_DAYS + 1)
+    percentiles = np.percentile(days, [10, 25, 50, 75, 90]) if len(days) else np.zeros(5)
+    return histogram, percentiles
+
+def occupancy_mix(data: Dict[str, np.ndarray]):
+    keys, counts = np.unique(data['adults'].astype(np.int64) * MAX_GUESTS + data['children'], return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return keys[order] // MAX_GUESTS, keys[order] % MAX_GUESTS, counts[order]
+
+def no_availability_by_month(data: Dict[str, np.ndarray]):
+    """Share of checked inquiries per arrival month that found no room."""
+    checked = np.isin(data['outcome'], ('available', 'no_availability'))
+    months = data['check_in'][checked].astype('datetime64[M]')
+    if not len(months):
+        return np.array([], dtype='datetime64[M]'), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    first = months.min()
+    index = (months - first).astype(np.int64)
+    totals = np.bincount(index)
+    misses = np.bincount(index, weights=data['outcome'][checked] == 'no_availability', minlength=len(totals)).astype(np.int64)
+    return first + np.arange(len(totals)), totals, misses
+
+
+def write_reports(data: Dict[str, np.ndarray], output_dir: str) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    dates, room_nights = room_nights_per_date(data)
+    lead_histogram, lead_percentiles = lead_times(data)
+    mix_adults, mix_children, mix_counts = occupancy_mix(data)
+    months, month_totals, month_misses = no_availability_by_month(data)
+    rates = np.divide(month_misses, month_totals, out=np.zeros(len(month_totals)), where=month_totals > 0)
+
+    np.savez_compressed(
+        os.path.join(output_dir, "demand.npz"),
+        dates=dates, room_nights=room_nights,
+        lead_time_histogram=lead_histogram, lead_time_percentiles=lead_percentiles,
+        mix_adults=mix_adults, mix_children=mix_children, mix_counts=mix_counts,
+        months=months, month_inquiries=month_totals, month_no_availability=month_misses,
+    )
+    np.savetxt(os.path.join(output_dir, "room_nights.csv"), np.column_stack([dates.astype(str), room_nights]),
+               fmt='%s', delimiter=',', header='date,room_nights', comments='')
+    np.savetxt(os.path.join(output_dir, "lead_times.csv"), np.column_stack([np.arange(len(lead_histogram)), lead_histogram]),
+               fmt='%d', delimiter=',', header='days_before_arrival,inquiries', comments='')
+    np.savetxt(os.path.join(output_dir, "occupancy_mix.csv"), np.column_stack([mix_adults, mix_children, mix_counts]),
+               fmt='%d', delimiter=',', header='adults,children,inquiries', comments='')
+    np.savetxt(os.path.join(output_dir, "no_availability.csv"), np.column_stack([months.astype(str), month_totals, month_misses, np.round(rates, 4)]),
+               fmt='%s', delimiter=',', header='month,checked_inquiries,no_availability,rate', comments='')
+    logger.warning(f"Wrote demand reports for {len(data['check_in'])} inquiries to {output_dir}; "
+                   f"lead time p50 {lead_percentiles[2]:.0f} days, p90 {lead_percentiles[4]:.0f} days")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Aggregate stored inquiries into demand reports")
+    arg_parser.add_argument("--db", help="Reservation store written by the mail processor")
+    arg_parser.add_argument("--backfill", action="append", default=[], help="Backfill output directory; may be repeated")
+    arg_parser.add_argument("--output-dir", default="demand_reports")
+    args = arg_parser.parse_args()
+
+    datasets = ([load_store(args.db)] if args.db else []) + [load_backfill(path) for path in args.backfill]
+    if not datasets:
+        arg_parser.error("nothing to analyse, pass --db and/or --backfill")
+    write_reports(concatenate(*datasets), args.output_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -18,29 +18,27 @@ from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeo
 import traceback
 import logging
 from typing import List, Dict, Any, Optional
-import unicodedata
 import spacy
 from spacy.matcher import Matcher
 from datetime import datetime, timedelta
 import re
-from transliterate import detect_language as transliterate_detect_language, translit
+
+from text_normalization import normalize
+from date_grammar import parse_date_text, reference_today
+from offline_resolver import replace_number_words
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 ###############################################################################################
-def normalize_text(text: str) -> str:
-    return text.lower()
-
 def get_staff_email():
     return os.environ['STAFF_EMAIL']
 
-def detect_language(text: str) -> str:
-    lang = transliterate_detect_language(text)
-    return 'el' if lang == 'el' else 'en'
-
 ###############################################################################################d
 
 def parse_english_date(date_str: str) -> datetime.date:
+    parsed = parse_date_text(date_str)
+    if parsed:
+        return parsed
     months = {
         'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
         'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
@@ -58,7 +56,7 @@ def parse_english_date(date_str: str) -> datetime.date:
             else:
                 month = int(month)
             day = int(day)
-            year = int(year) if year else datetime.now().year
+            year = int(year) if year else reference_today().year
             if year < 100:
                 year += 2000
             return datetime(year, month, day).date()
@@ -109,6 +107,9 @@ def parse_english_request(email_body: str) -> Dict[str, Any]:
 #################################################################d
 def parse_greek_date(date_str: str) -> datetime.date:
     logging.debug(f"Attempting to parse date: {date_str}")
+    parsed = parse_date_text(date_str)
+    if parsed:
+        return parsed
     greek_months = {
         'ιαν': 1, 'φεβ': 2, 'μαρ': 3, 'απρ': 4, 'μαι': 5, 'ιουν': 6,
         'ιουλ': 7, 'αυγ': 8, 'σεπ': 9, 'οκτ': 10, 'νοε': 11, 'δεκ': 12
@@ -120,7 +121,7 @@ def parse_greek_date(date_str: str) -> datetime.date:
     if '/' in date_str:
         try:
             day, month = map(int, date_str.split('/'))
-            year = datetime.now().year
+            year = reference_today().year
             return datetime(year, month, day).date()
         except ValueError:
             logging.debug(f"Failed to parse {date_str} as DD/MM format")
@@ -131,7 +132,7 @@ def parse_greek_date(date_str: str) -> datetime.date:
         try:
             day = int(parts[0])
             month_str = parts[1][:3]  # Take only the first three letters
-            year = datetime.now().year
+            year = reference_today().year
             
             if month_str in greek_months:
                 month = greek_months[month_str]
@@ -148,8 +149,8 @@ def parse_greek_date(date_str: str) -> datetime.date:
     raise ValueError(f"Unable to parse date: {date_str}")
 
 def parse_format_1(email_body: str) -> Optional[Dict[str, Any]]:
-    """Parse format: 'θελω 2 δωματια για 26 οκτωβριου για 3 νυχτες'"""
-    pattern = r'(\d+)\s*(?:δωματια|δωμάτια).*?(\d+)\s*([α-ωίϊΐόάέύϋΰήώ]+).*?(\d+)\s*(?:νυχτες|νύχτες|βραδια|βράδια)'
+    """Parse format: 'θελω 2 δωματια για 26 οκτωβριου για 3 νυχτεσ' (folded text)"""
+    pattern = r'(\d+)\s*δωματια.*?(\d+)\s*([α-ω]+).*?(\d+)\s*(?:νυχτεσ|βραδια)'
     match = re.search(pattern, email_body, re.IGNORECASE)
     if match:
         rooms, day, month, nights = match.groups()
@@ -160,6 +161,7 @@ def parse_format_1(email_body: str) -> Optional[Dict[str, Any]]:
                 'check_out': check_in + timedelta(days=int(nights)),
                 'nights': int(nights),
                 'adults': int(rooms) * 2,  # Assuming 2 adults per room
+                'rooms': int(rooms),
                 'room_type': 'δωμάτιο' if int(rooms) == 1 else 'δωμάτια'
             }
         except ValueError:
@@ -170,7 +172,7 @@ def parse_format_2(email_body: str) -> Optional[Dict[str, Any]]:
     logging.info("Parsing email content (Format 2):")
     logging.info(email_body)
     
-    pattern = r'(?:για|από)\s*(\d{1,2}/\d{1,2}).*?(?:εως|έως|μέχρι)\s*(\d{1,2}/\d{1,2})'
+    pattern = r'(?:για|απο)\s*(\d{1,2}/\d{1,2}).*?(?:εωσ|μεχρι)\s*(\d{1,2}/\d{1,2})'
     match = re.search(pattern, email_body, re.IGNORECASE)
     if match:
         try:
@@ -200,26 +202,26 @@ def parse_format_3(email_body: str) -> Optional[Dict[str, Any]]:
     adults = children = check_in = check_out = None
     
     for line in lines:
-        if 'άτομα' in line:
-            adults_match = re.search(r'(\d+)\s*άτομα', line)
+        if 'ατομα' in line:
+            adults_match = re.search(r'(\d+)\s*ατομα', line)
             if adults_match:
                 adults = int(adults_match.group(1))
                 logging.info(f"Extracted adults: {adults}")
-        elif 'παιδιά' in line:
-            children_match = re.search(r'(\d+)\s*παιδιά', line)
+        elif 'παιδια' in line:
+            children_match = re.search(r'(\d+)\s*παιδια', line)
             if children_match:
                 children = int(children_match.group(1))
                 logging.info(f"Extracted children: {children}")
-        elif 'από' in line:
-            date_match = re.search(r'από\s+(.+)', line)
+        elif 'απο' in line:
+            date_match = re.search(r'απο\s+(.+)', line)
             if date_match:
                 try:
                     check_in = parse_greek_date(date_match.group(1))
                     logging.info(f"Extracted check-in date: {check_in}")
                 except ValueError as e:
                     logging.error(f"Error parsing check-in date: {str(e)}")
-        elif 'εώς' in line or 'έως' in line:
-            date_match = re.search(r'(?:εώς|έως)\s+(.+)', line)
+        elif 'εωσ' in line:
+            date_match = re.search(r'εωσ\s+(.+)', line)
             if date_match:
                 try:
                     check_out = parse_greek_date(date_match.group(1))
@@ -261,8 +263,9 @@ def parse_greek_request(email_body: str) -> Dict[str, Any]:
 def parse_reservation_request(email_body: str) -> Dict[str, Any]:
     logging.info("Parsing reservation request")
     
-    normalized_text = normalize_text(email_body)
-    language = detect_language(normalized_text)
+    normalized = normalize(email_body)
+    normalized_text = replace_number_words(normalized.folded)
+    language = normalized.language
     
     logging.info(f"Detected language: {language}")
     
@@ -339,7 +342,7 @@ def parse_numeric_fields(reservation_info):
 
     
 def is_greek(text):
-    return bool(re.search(r'[\u0370-\u03FF]', text))
+    return normalize(text).is_greek
 
 def scrape_thekokoon_availability(check_in, check_out, adults, children):
     base_url = f"https://thekokoonvolos.reserve-online.net/?checkin={check_in.strftime('%Y-%m-%d')}&rooms=1&nights={(check_out - check_in).days}&adults={adults}&src=107"
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import random
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Any, Optional, List, Callable
+
+from date_grammar import reference_date_scope, reference_today
+from resilience import deadline_scope
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+FIELDS = ('check_in', 'check_out', 'nights', 'adults', 'children')
+EVAL_LLM_COST_PER_1K_TOKENS = float(os.getenv("EVAL_LLM_COST_PER_1K_TOKENS", "0.00015"))
+SHADOW_EXTRACTOR = os.getenv("SHADOW_EXTRACTOR", "")
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH", "shadow_disagreements.jsonl")
+# Shadow runs happen off the email's path: a sampled share of emails, each on its own deadline
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "1"))
+SHADOW_DEADLINE_SECONDS = float(os.getenv("SHADOW_DEADLINE_SECONDS", "30"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "20"))
+
+
+def load_llm_extractor() -> Callable[[str], Dict[str, Any]]:
+    import demail_processor
+
+    def extract(body: str) -> Dict[str, Any]:
+        prompt_body = demail_processor.prune_email_body(demail_processor.clean_email_body(body))
+        # Counted per call on this thread; the shared ROUTE_STATS also move with live mail on other threads
+        with demail_processor.route_stats_scope() as route_stats:
+            reservation_info = demail_processor.extract_reservation_info(prompt_body)
+        calls = sum(route_stats[route]['calls'] for route, _ in demail_processor.EXTRACTION_ROUTES)
+        prompt_tokens = demail_processor.estimate_tokens(demail_processor.EXTRACTION_PROMPT) + demail_processor.estimate_tokens(prompt_body)
+        repair_tokens = demail_processor.estimate_tokens(demail_processor.REPAIR_PROMPT) + demail_processor.REPAIR_TOKEN_BUDGET
+        repairs = route_stats['repair']['calls']
+        reservation_info['_cost'] = (calls * prompt_tokens + repairs * repair_tokens) / 1000 * EVAL_LLM_COST_PER_1K_TOKENS
+        return reservation_info
+    return extract
+
+def load_email_processor_patterns_extractor() -> Callable[[str], Dict[str, Any]]:
+    # email_processor.py's own pattern parser, not the LLM-plus-regex chain in demail_processor; it needs spaCy
+    import email_processor
+    return email_processor.parse_reservation_request
+
+def load_folder_patterns_extractor() -> Callable[[str], Dict[str, Any]]:
+    spec = importlib.util.spec_from_file_location("folder_email_processor", os.path.join(REPO_DIR, "folder", "email_processor(5).py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.parse_reservation_request
+
+def load_offline_extractor() -> Callable[[str], Dict[str, Any]]:
+    from offline_resolver import extract_offline
+    return extract_offline
+
+EXTRACTOR_LOADERS = {
+    'llm': load_llm_extractor,
+    'offline': load_offline_extractor,
+    'email_processor_patterns': load_email_processor_patterns_extractor,
+    'folder_patterns': load_folder_patterns_extractor,
+}
+_loaded_extractors: Dict[str, Callable[[str], Dict[str, Any]]] = {}
+
+
+def get_extractor(name: str) -> Optional[Callable[[str], Dict[str, Any]]]:
+    if name not in _loaded_extractors:
+        try:
+            _loaded_extractors[name] = EXTRACTOR_LOADERS[name]()
+        except Exception as e:
+            logger.error(f"Extractor {name} is unavailable: {type(e).__name__}: {e}")
+            return None
+    return _loaded_extractors[name]
+
+def normalize_fields(reservation_info: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for field in FIELDS:
+        value = reservation_info.get(field)
+        if isinstance(value, date):
+            value = value.isoformat()
+        elif isinstance(value, str) and value.isdigit():
+            value = int(value)
+        normalized[field] = value
+    return normalized
+
+def run_extractor(extract: Callable[[str], Dict[str, Any]], body: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        reservation_info = extract(body) or {}
+        error = None
+    except Exception as e:
+        reservation_info, error = {}, f"{type(e).__name__}: {e}"
+    return {
+        'fields': normalize_fields(reservation_info),
+        'latency': time.perf_counter() - started,
+        'cost': reservation_info.get('_cost', 0.0),
+        'error': error,
+    }
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def evaluate(corpus: List[Dict[str, Any]], extractor_names: List[str]) -> Dict[str, Any]:
+    """Field-level precision/recall plus latency and cost for every extractor over a labeled corpus."""
+    report = {}
+    for name in extractor_names:
+        extract = get_extractor(name)
+        if extract is None:
+            continue
+        counts = {field: {'predicted': 0, 'expected': 0, 'correct': 0} for field in FIELDS}
+        latencies, cost, errors = [], 0.0, 0
+        for example in corpus:
+            expected = normalize_fields(example['expected'])
+            # Year-less and relative dates resolve against the day the example was written, not the day of the eval
+            reference = example.get('reference_date')
+            with reference_date_scope(date.fromisoformat(reference) if reference else None):
+                outcome = run_extractor(extract, example['body'])
+            latencies.append(outcome['latency'])
+            cost += outcome['cost']
+            errors += outcome['error'] is not None
+            for field in FIELDS:
+                predicted = outcome['fields'][field]
+                counts[field]['predicted'] += predicted is not None
+                counts[field]['expected'] += expected[field] is not None
+                counts[field]['correct'] += predicted is not None and predicted == expected[field]
+        report[name] = {
+            'fields': {
+                field: {
+                    'precision': c['correct'] / c['predicted'] if c['predicted'] else 0.0,
+                    'recall': c['correct'] / c['expected'] if c['expected'] else 0.0,
+                }
+                for field, c in counts.items()
+            },
+            'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'cost_per_email': cost / len(corpus) if corpus else 0.0,
+            'errors': errors,
+        }
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    for name, result in report.items():
+        print(f"\n{name}: mean {result['latency_mean'] * 1000:.1f} ms, p95 {result['latency_p95'] * 1000:.1f} ms, "
+              f"${result['cost_per_email']:.5f}/email, {result['errors']} errors")
+        for field, scores in result['fields'].items():
+            print(f"  {field:<10} precision {scores['precision']:.2f}  recall {scores['recall']:.2f}")
+
+def run_shadow(body: str, primary_info: Dict[str, Any], message_id: str, candidate: str = SHADOW_EXTRACTOR) -> None:
+    """Run a candidate extractor next to the primary one and log any field where they disagree."""
+    extract = get_extractor(candidate)
+    if extract is None:
+        return
+    outcome = run_extractor(extract, body)
+    primary = normalize_fields(primary_info)
+    disagreements = {
+        field: {'primary': primary[field], 'candidate': outcome['fields'][field]}
+        for field in FIELDS if primary[field] != outcome['fields'][field]
+    }
+    logger.info(f"Shadow extractor {candidate} took {outcome['latency'] * 1000:.1f} ms, {len(disagreements)} disagreements")
+    if disagreements or outcome['error']:
+        with open(SHADOW_LOG_PATH, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'message_id': message_id,
+                'candidate': candidate,
+                'latency': outcome['latency'],
+                'error': outcome['error'],
+                'disagreements': disagreements,
+            }, ensure_ascii=False) + '\n')
+
+_shadow_executor: Optional[ThreadPoolExecutor] = None
+_shadow_pending = threading.Semaphore(SHADOW_MAX_PENDING)
+
+def _run_shadow_in_background(body: str, primary_info: Dict[str, Any], message_id: str, today: date) -> None:
+    try:
+        with deadline_scope(SHADOW_DEADLINE_SECONDS), reference_date_scope(today):
+            run_shadow(body, primary_info, message_id)
+    except Exception as e:
+        logger.error(f"Shadow extraction failed: {type(e).__name__}: {e}")
+    finally:
+        _shadow_pending.release()
+
+def submit_shadow(body: str, primary_info: Dict[str, Any], message_id: str) -> None:
+    """Queue a shadow run on the background worker, skipping it when unsampled or the queue is full."""
+    global _shadow_executor
+    if not SHADOW_EXTRACTOR or random.random() >= SHADOW_SAMPLE_RATE:
+        return
+    if not _shadow_pending.acquire(blocking=False):
+        logger.warning(f"Shadow queue is full, skipping shadow run for {message_id}")
+        return
+    if _shadow_executor is None:
+        _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-extractor")
+    _shadow_executor.submit(_run_shadow_in_background, body, dict(primary_info), message_id, reference_today())
+
+def shutdown_shadow() -> None:
+    """Let queued shadow runs finish; each is bounded by SHADOW_DEADLINE_SECONDS."""
+    global _shadow_executor
+    if _shadow_executor is not None:
+        _shadow_executor.shutdown(wait=True)
+        _shadow_executor = None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare reservation extractors over a labeled JSONL corpus")
+    arg_parser.add_argument("corpus", help="JSONL file with 'body', 'expected' and optional 'reference_date' fields per line")
+    arg_parser.add_argument("--extractors", default=",".join(EXTRACTOR_LOADERS), help="Comma-separated extractor names")
+    arg_parser.add_argument("--output", help="Write the full report as JSON to this path")
+    args = arg_parser.parse_args()
+
+    with open(args.corpus, encoding='utf-8') as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    report = evaluate(corpus, [name.strip() for name in args.extractors.split(',') if name.strip()])
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 0 if report else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
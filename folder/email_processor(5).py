@@ -18,28 +18,14 @@ from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeo
 import traceback
 import logging
 from typing import List, Dict, Any
-import unicodedata
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def strip_accents(text):
-    return ''.join(char for char in unicodedata.normalize('NFKD', text) if unicodedata.category(char) != 'Mn')
-
-month_mapping = {
-    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
-    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
-    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'june': 6,
-    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
-    'ιαν': 1, 'φεβ': 2, 'μαρ': 3, 'απρ': 4, 'μαι': 5, 'ιουν': 6,
-    'ιουλ': 7, 'αυγ': 8, 'σεπ': 9, 'οκτ': 10, 'νοε': 11, 'δεκ': 12,
-    'ιανουαριος': 1, 'φεβρουαριος': 2, 'μαρτιος': 3, 'απριλιος': 4, 'μαιος': 5,
-    'ιουνιος': 6, 'ιουλιος': 7, 'αυγουστος': 8, 'σεπτεμβριος': 9,
-    'οκτωβριος': 10, 'νοεμβριος': 11, 'δεκεμβριος': 12,
-    'ιανουαριου': 1, 'φεβρουαριου': 2, 'μαρτιου': 3, 'απριλιου': 4, 'μαιου': 5,
-    'ιουνιου': 6, 'ιουλιου': 7, 'αυγουστου': 8, 'σεπτεμβριου': 9,
-    'οκτωβριου': 10, 'νοεμβριου': 11, 'δεκεμβριου': 12
-}
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_normalization import fold, normalize
+from date_grammar import find_stay, parse_date_text, reference_today
+from offline_resolver import replace_number_words, resolve_relative
 
 def get_staff_email():
     return os.environ['STAFF_EMAIL']
@@ -90,22 +76,22 @@ def get_patterns():
     return {
         'check_in': [
             r'(?:check[ -]?in|arrival|from|αφιξη|απο|για)[\s:]+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
-            r'(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)\s+(?:εως|μεχρι|to|till)',
+            r'(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)\s+(?:εωσ|μεχρι|to|till)',
             r'(?:απο|from)\s+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
             r'check\s*in\s*(\d{1,2}\s*(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s*(?:\d{2,4})?)',
         ],
         'check_out': [
-            r'(?:check[ -]?out|departure|to|until|till|αναχωρηση|μεχρι|εως)[\s:]+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
-            r'(?:εως|μεχρι|to|till)\s+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
+            r'(?:check[ -]?out|departure|to|until|till|αναχωρηση|μεχρι|εωσ)[\s:]+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
+            r'(?:εωσ|μεχρι|to|till)\s+(\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?)',
             r'check\s*out\s*(\d{1,2}\s*(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s*(?:\d{2,4})?)',
         ],
         'nights': [
-            r'(?:για|for)\s+(\d+)\s*(?:nights?|νυχτες?|βραδια)',
-            r'(\d+)\s*(?:nights?|νυχτες?|βραδια)',
+            r'(?:για|for)\s+(\d+)\s*(?:nights?|νυχτεσ?|βραδια)',
+            r'(\d+)\s*(?:nights?|νυχτεσ?|βραδια)',
         ],
         'adults': [
-            r'(?:adults?|persons?|people|guests?|ενηλικες|ατομα)[\s:]+(\d+)',
-            r'(\d+)\s+(?:adults?|persons?|people|guests?|ενηλικες|ατομα)',
+            r'(?:adults?|persons?|people|guests?|ενηλικεσ|ατομα)[\s:]+(\d+)',
+            r'(\d+)\s+(?:adults?|persons?|people|guests?|ενηλικεσ|ατομα)',
         ],
         'children': [
             r'(?:children|kids|παιδια)[\s:]+(\d+)',
@@ -128,48 +114,14 @@ def extract_info(email_body, patterns):
 
 
 def parse_custom_date(date_string):
-    date_string = strip_accents(date_string.lower().strip())
-    current_year = datetime.now().year
+    date_string = fold(date_string.strip())
+    current_year = reference_today().year
     
-    date_formats = [
-        r'(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2,4}))?',  # DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY
-        r'(\d{1,2})\s*([α-ωa-z]+)(?:\s*(\d{2,4}))?',    # DD Month YYYY (including Greek)
-        r'([α-ωa-z]+)\s*(\d{1,2})(?:,?\s*(\d{2,4}))?',  # Month DD, YYYY (including Greek)
-        r'([α-ωa-z]+)\s*(\d{1,2})(?:st|nd|rd|th)?(?:,?\s*(\d{2,4}))?',  # Month DDst/nd/rd/th, YYYY (including Greek)
-    ]
-
-    for date_format in date_formats:
-        match = re.search(date_format, date_string, re.IGNORECASE)
-        if match:
-            groups = match.groups()
-            
-            if groups[0].isalpha():
-                month, day, year = groups
-            elif groups[1].isalpha():
-                day, month, year = groups
-            else:
-                day, month, year = groups
-            
-            if isinstance(month, str) and month.isalpha():
-                month = month.lower()
-                if month in month_mapping:
-                    month = month_mapping[month]
-                else:
-                    raise ValueError(f"Unknown month: {month}")
-            
-            day = int(day)
-            month = int(month)
-            year = int(year) if year else current_year
-
-            if year and len(str(year)) == 2:
-                year += 2000 if year < 50 else 1900
-
-            try:
-                return datetime(year, month, day).date()
-            except ValueError as e:
-                raise ValueError(f"Invalid date: {date_string}. Error: {str(e)}")
+    parsed_date = parse_date_text(date_string)
+    if parsed_date:
+        return parsed_date
 
-    # If no format matches, try dateutil parser as a fallback
+    # Only text the date grammar does not recognise reaches the much slower fuzzy dateutil parser
     try:
         parsed_date = date_parser.parse(date_string, fuzzy=True).date()
         # If the parsed year is in the past, assume it's for next year
@@ -215,12 +167,20 @@ def parse_numeric_fields(reservation_info):
     return reservation_info
 
 def parse_reservation_request(email_body):
-    email_body = strip_accents(email_body.lower())
+    email_body = replace_number_words(normalize(email_body).folded)
     patterns = get_patterns()
     
     reservation_info = extract_info(email_body, patterns)
     reservation_info = parse_numeric_fields(reservation_info)
     reservation_info = parse_dates(reservation_info)
+    if 'check_in' not in reservation_info:
+        # Ranges such as "10-14/8" or "απο 3 εωσ 7 ιουλιου" are not captured by the field patterns,
+        # and holidays or relative phrases ("το πασχα", "next weekend") carry no digits at all
+        stay = find_stay(email_body) or resolve_relative(email_body, reference_today())
+        if stay:
+            reservation_info['check_in'] = stay[0]
+            if stay[1]:
+                reservation_info['check_out'] = stay[1]
     reservation_info = calculate_checkout(reservation_info)
     
     # Ensure 'nights' is correctly reflected in the reservation_info
@@ -237,7 +197,7 @@ def parse_reservation_request(email_body):
     return reservation_info
     
 def is_greek(text):
-    return bool(re.search(r'[\u0370-\u03FF]', text))
+    return normalize(text).is_greek
 
 def scrape_thekokoon_availability(check_in, check_out, adults, children):
     base_url = f"https://thekokoonvolos.reserve-online.net/?checkin={check_in.strftime('%Y-%m-%d')}&rooms=1&nights={(check_out - check_in).days}&adults={adults}&src=107"
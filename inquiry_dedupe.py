@@ -0,0 +1,113 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Iterable, Optional, List
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_INDEX_PATH = os.getenv("DEDUPE_INDEX_PATH", "inquiry_index.json")
+DUPLICATE_WINDOW_HOURS = float(os.getenv("DUPLICATE_WINDOW_HOURS", "72"))
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "3"))
+# Short and empty bodies all hash alike, so they are never treated as duplicates
+DEDUPE_MIN_BODY_CHARS = int(os.getenv("DEDUPE_MIN_BODY_CHARS", "80"))
+SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r'\w+')
+NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """64-bit SimHash over word shingles."""
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = [' '.join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def number_signature(text: str) -> str:
+    # Two inquiries that differ only in a date or guest count look alike to SimHash but are not duplicates
+    return ' '.join(NUMBER_PATTERN.findall(text))
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class InquiryIndex:
+    """Recent inquiry fingerprints and their processing results, persisted as JSON."""
+
+    def __init__(self, path: str = DEDUPE_INDEX_PATH, window_hours: float = DUPLICATE_WINDOW_HOURS):
+        self.path = path
+        self.window_seconds = window_hours * 3600
+        self.lock = threading.Lock()
+        self.entries: List[Dict[str, Any]] = []
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read inquiry index {path}, starting empty: {e}")
+
+    def find_duplicate(self, body: str, sender: str, thread_ids: Iterable[str] = (), now: Optional[float] = None,
+                       outcomes: Optional[Iterable[str]] = None, message_id: str = '') -> Optional[Dict[str, Any]]:
+        """An earlier inquiry with the same text from the same sender or in the same thread.
+
+        Two guests sending the same templated inquiry are two inquiries, so other senders never match.
+        With `outcomes`, only earlier inquiries whose result had one of those outcomes count. The message's
+        own earlier entry, left by a run that failed to mark it read, is never its duplicate.
+        """
+        if len(body.strip()) < DEDUPE_MIN_BODY_CHARS:
+            return None
+        now = now or time.time()
+        sender = sender.lower()
+        thread_ids = set(filter(None, thread_ids))
+        fingerprint, numbers = simhash(body), number_signature(body)
+        outcomes = set(outcomes) if outcomes is not None else None
+        with self.lock:
+            for entry in reversed(self.entries):
+                if now - entry['received'] > self.window_seconds:
+                    break
+                if message_id and entry['message_id'] == message_id:
+                    continue
+                if entry['sender'].lower() != sender and entry['message_id'] not in thread_ids:
+                    continue
+                if outcomes is not None and entry['result'].get('outcome') not in outcomes:
+                    continue
+                if entry['numbers'] == numbers and hamming_distance(entry['simhash'], fingerprint) <= SIMHASH_MAX_DISTANCE:
+                    return entry
+        return None
+
+    def add(self, body: str, message_id: str, sender: str, result: Dict[str, Any], now: Optional[float] = None) -> None:
+        now = now or time.time()
+        with self.lock:
+            self.entries = [entry for entry in self.entries if now - entry['received'] <= self.window_seconds]
+            self.entries.append({
+                'simhash': simhash(body),
+                'numbers': number_signature(body),
+                'received': now,
+                'message_id': message_id,
+                'sender': sender,
+                'result': json.loads(json.dumps(result, default=str)),
+            })
+            self.save()
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+_index: Optional[InquiryIndex] = None
+
+def get_inquiry_index() -> InquiryIndex:
+    global _index
+    if _index is None:
+        _index = InquiryIndex()
+    return _index
@@ -0,0 +1,95 @@
+import os
+import re
+import logging
+from collections import Counter
+from email.message import Message
+
+from text_normalization import fold, normalize
+
+logger = logging.getLogger(__name__)
+
+INQUIRY = 'inquiry'
+
+
+def _address_list(value: str) -> set:
+    return {item.strip().lower() for item in value.split(',') if item.strip()}
+
+TRIAGE_ALLOWED_SENDERS = _address_list(os.getenv("TRIAGE_ALLOWED_SENDERS", ""))
+TRIAGE_DENIED_SENDERS = _address_list(os.getenv("TRIAGE_DENIED_SENDERS", ""))
+OWN_ADDRESSES = _address_list(",".join(filter(None, [os.getenv("EMAIL_ADDRESS"), os.getenv("STAFF_EMAIL")])))
+
+# Only unmistakable phrases: a guest's "Vacation in Volos" subject must stay an inquiry. RFC 3834 headers do the rest.
+AUTO_REPLY_SUBJECT = re.compile(
+    r'^(auto(matic)?[ -]?(reply|response)|out of (the )?office|autoreply|αυτοματη απαντηση|εκτοσ γραφειου)',
+    re.IGNORECASE
+)
+BOUNCE_SENDER = re.compile(r'^(mailer-daemon|postmaster|bounces?)[@+]', re.IGNORECASE)
+# Every subject the bot sends to staff, folded: accents stripped and final sigma written as σ
+OWN_NOTIFICATION_SUBJECT = re.compile(
+    r'^(new reservation request|repeated reservation request|error processing reservation request|'
+    r'reservation requests digest|νεο αιτημα κρατησησ|επαναληψη αιτηματοσ κρατησησ)',
+    re.IGNORECASE
+)
+FORWARD_SUBJECT = re.compile(r'^(fwd?|fw|πρθ|προωθ\w*):', re.IGNORECASE)
+
+# Matched against folded text: lowercased, accent-stripped, final sigma as σ
+INQUIRY_KEYWORDS = re.compile(
+    r'reserv|\bbook|availab|room|suite|loft|night|adult|child|kid|check[ -]?in|check[ -]?out|arriv|depart|stay|'
+    r'κρατησ|διαθεσιμ|δωματι|διανυκτ|νυχτ|βραδι|ενηλικ|ατομ|παιδι|αφιξ|αναχωρ|διαμον'
+)
+NON_INQUIRY_KEYWORDS = re.compile(
+    r'invoice|receipt|newsletter|unsubscribe|webinar|password|verify your|order confirmation|payment received|'
+    r'τιμολογ|αποδειξ|ενημερωτικο|διαγραφ|κωδικ|παραγγελι'
+)
+DATE_LIKE = re.compile(r'\b\d{1,2}\s*[/.-]\s*\d{1,2}\b')
+
+triage_counts: Counter = Counter()
+
+
+def sender_matches(sender: str, addresses: set) -> bool:
+    sender = sender.lower()
+    return sender in addresses or ('@' + sender.rpartition('@')[2]) in addresses
+
+def classify_headers(msg: Message, sender: str) -> str:
+    subject = fold(str(msg.get('Subject', '')).strip())
+    auto_submitted = str(msg.get('Auto-Submitted', 'no')).strip().lower()
+    return_path = str(msg.get('Return-Path', '')).strip()
+    precedence = str(msg.get('Precedence', '')).strip().lower()
+
+    if return_path == '<>' or BOUNCE_SENDER.match(sender) or msg.get_content_type() == 'multipart/report':
+        return 'bounce'
+    if (auto_submitted != 'no' or msg.get('X-Autoreply') or msg.get('X-Autorespond') or precedence == 'auto_reply'
+            or AUTO_REPLY_SUBJECT.match(subject)):
+        return 'auto_reply'
+    if msg.get('List-Id') or msg.get('List-Unsubscribe') or precedence in ('bulk', 'list', 'junk'):
+        return 'mailing_list'
+    if sender_matches(sender, TRIAGE_DENIED_SENDERS):
+        return 'denied_sender'
+    if sender_matches(sender, OWN_ADDRESSES) and (OWN_NOTIFICATION_SUBJECT.match(subject) or not FORWARD_SUBJECT.match(subject)):
+        return 'own_mail'
+    return INQUIRY
+
+def classify_text(subject: str, body: str) -> str:
+    # The body was already folded for language detection, so reuse it
+    text = f"{fold(subject)}\n{normalize(body).folded[:4000]}"
+    positive = len(INQUIRY_KEYWORDS.findall(text)) + len(DATE_LIKE.findall(text))
+    negative = len(NON_INQUIRY_KEYWORDS.findall(text))
+    if positive == 0 or (negative >= 2 and negative >= positive):
+        return 'non_inquiry'
+    return INQUIRY
+
+def triage_email(msg: Message, sender: str, body: str) -> str:
+    """Categorise a message from headers and keywords before any LLM or browser work."""
+    if sender_matches(sender, TRIAGE_ALLOWED_SENDERS):
+        category = INQUIRY
+    else:
+        category = classify_headers(msg, sender)
+        if category == INQUIRY:
+            category = classify_text(str(msg.get('Subject', '')), body)
+    triage_counts[category] += 1
+    logger.info(f"Triage category for message from {sender}: {category}")
+    return category
+
+def log_triage_counts() -> None:
+    for category, count in sorted(triage_counts.items()):
+        logger.info(f"Triage {category}: {count}")
@@ -0,0 +1,230 @@
+import re
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from text_normalization import normalize
+from date_grammar import find_dates, reference_today
+
+# Folded forms; Greek numerals agree in gender, so every form maps to the same number
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'fourteen': 14,
+    'ενα': 1, 'ενασ': 1, 'μια': 1, 'μιαν': 1, 'δυο': 2, 'τρια': 3, 'τρεισ': 3,
+    'τεσσερα': 4, 'τεσσερισ': 4, 'πεντε': 5, 'εξι': 6, 'επτα': 7, 'εφτα': 7,
+    'οκτω': 8, 'οχτω': 8, 'εννεα': 9, 'εννια': 9, 'δεκα': 10, 'εντεκα': 11, 'δωδεκα': 12,
+}
+NUMBER_WORD = re.compile(r'\b(' + '|'.join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r')\b')
+WEEK_STAY = re.compile(r'\b(?:for|για)\s+(?:a\s+)?(?:(\d+)\s+)?(?:weeks?|εβδομαδ(?:α|εσ))\b')
+
+NIGHTS = re.compile(r'(\d+)\s*(?:nights?|νυχτ(?:α|εσ)|βραδι(?:α|εσ)?|βραδυ|διανυκτερευσ(?:η|εισ))\b')
+ADULTS = re.compile(r'(\d+)\s*(?:adults?|ενηλικ(?:ασ|εσ|α|οι|ουσ))\b')
+# "4 people" or "4 ατομα" is the whole party, children included
+PARTY = re.compile(r'(\d+)\s*(?:persons?|people|guests?|ατομα)\b')
+CHILDREN = re.compile(r'(\d+)\s*(?:children|child|kids?|παιδια|παιδι)\b')
+ROOMS = re.compile(r'(\d+)\s*(?:(?:double|twin|triple|family|δικλιν\w*|τρικλιν\w*|οικογενειακ\w*)\s+)?(?:rooms?|δωματι(?:ο|α))\b')
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+    'δευτερα': 0, 'τριτη': 1, 'τεταρτη': 2, 'πεμπτη': 3, 'παρασκευη': 4, 'σαββατο': 5, 'κυριακη': 6,
+}
+NEXT_WORDS = r'(?:next|following|επομεν\w*|αλλ(?:ο|η)|ερχομεν\w*)'
+RELATIVE_DAY = re.compile(r'\b(today|tonight|σημερα|αποψε|tomorrow|αυριο|day after tomorrow|μεθαυριο)\b')
+IN_DAYS = re.compile(r'\b(?:in|σε)\s+(\d+)\s+(days?|weeks?|μερεσ|ημερεσ|εβδομαδεσ)\b')
+WEEKEND = re.compile(r'\b(?:(this|αυτο\s+το|το)\s+|(' + NEXT_WORDS + r')\s+(?:το\s+)?)?(?:weekend|σαββατοκυριακο)\b')
+NEXT_WEEK = re.compile(r'\b' + NEXT_WORDS + r'\s+(?:week|εβδομαδα)\b')
+WEEKDAY = re.compile(r'\b(' + '|'.join(WEEKDAYS) + r')\b')
+# A relative or weekday phrase only names the stay right after a stay word: "arriving next Monday", "από αύριο",
+# not "I'll call you on Monday" or "thank you for your email today"
+STAY_CONTEXT = re.compile(
+    r'\b(?:arriv\w*|from|check(?:ing)?[ -]?in|for|stay\w*|come|coming|visit\w*|αφιξ\w*|φτανουμε|ερχομαστε|απο|για|μενουμε)\s+'
+    r'(?:(?:on|the|this|starting|το|την|τη|στισ|' + NEXT_WORDS + r')\s+)*$'
+)
+
+# Long weekends and holidays, matched on folded text and resolved against the Orthodox calendar by default
+WESTERN_EASTER = re.compile(r'\b(?:western|catholic|καθολικ\w*)\s+(?:easter|πασχα)\b')
+HOLY_WEEK = re.compile(r'\b(?:easter\s+week|holy\s+week|μεγαλη\s+εβδομαδα|εβδομαδα\s+του\s+πασχα)\b')
+EASTER = re.compile(r'\b(?:easter|πασχα|πασχαλι\w*)\b')
+WHIT_MONDAY = re.compile(r'\b(?:whit\s+monday|pentecost|αγιου\s+πνευματοσ|αγιο\s+πνευμα)\b')
+CLEAN_MONDAY = re.compile(r'\b(?:clean\s+monday|καθαρ(?:α|η)\s+δευτερα|αποκρι\w*)\b')
+LONG_WEEKEND = re.compile(r'\b(?:long\s+weekend|τριημερο|τετραημερο)\b')
+FIXED_HOLIDAYS = (
+    (re.compile(r'\b(?:new\s+year\'?s?\s+eve|ρεβεγιον|παραμονη\s+(?:τησ\s+)?πρωτοχρονιασ)\b'), 12, 31),
+    (re.compile(r'\b(?:christmas|χριστουγενν\w*)\b'), 12, 24),
+    (re.compile(r'\b(?:new\s+year|πρωτοχρονια\w*)\b'), 1, 1),
+    (re.compile(r'\b(?:epiphany|θεοφανει\w*|φωτων)\b'), 1, 6),
+    (re.compile(r'\b(?:independence\s+day|25ησ\s+μαρτιου)\b'), 3, 25),
+    (re.compile(r'\b(?:may\s+day|labou?r\s+day|πρωτομαγια\w*)\b'), 5, 1),
+    (re.compile(r'\b(?:assumption|δεκαπενταυγουστ\w*|15αυγουστ\w*)\b'), 8, 15),
+    (re.compile(r'\b(?:ochi\s+day|28ησ\s+οκτωβριου|επετει\w*\s+του\s+οχι)\b'), 10, 28),
+)
+
+
+def replace_number_words(folded: str) -> str:
+    """'three nights', 'δυο ενηλικεσ' -> '3 nights', '2 ενηλικεσ'."""
+    return NUMBER_WORD.sub(lambda match: str(NUMBER_WORDS[match.group(1)]), folded)
+
+def western_easter(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+def orthodox_easter(year: int) -> date:
+    """Orthodox Easter Sunday: Meeus' Julian algorithm shifted to the Gregorian calendar (valid 1900-2099)."""
+    a, b, c = year % 4, year % 7, year % 19
+    d = (19 * c + 15) % 30
+    e = (2 * a + 4 * b - d + 34) % 7
+    month, day = divmod(d + e + 114, 31)
+    return date(year, month, day + 1) + timedelta(days=13)
+
+def greek_public_holidays(year: int) -> Dict[date, str]:
+    easter = orthodox_easter(year)
+    return {
+        date(year, 1, 1): "New Year's Day",
+        date(year, 1, 6): "Epiphany",
+        easter - timedelta(days=48): "Clean Monday",
+        date(year, 3, 25): "Independence Day",
+        easter - timedelta(days=2): "Good Friday",
+        easter: "Easter Sunday",
+        easter + timedelta(days=1): "Easter Monday",
+        date(year, 5, 1): "Labour Day",
+        easter + timedelta(days=50): "Whit Monday",
+        date(year, 8, 15): "Assumption",
+        date(year, 10, 28): "Ochi Day",
+        date(year, 12, 25): "Christmas Day",
+        date(year, 12, 26): "Boxing Day",
+    }
+
+def long_weekend(day: date) -> Tuple[date, date]:
+    """The run of weekend days and public holidays around a holiday, as arrival and departure dates."""
+    holidays = {**greek_public_holidays(day.year - 1), **greek_public_holidays(day.year), **greek_public_holidays(day.year + 1)}
+    is_off = lambda d: d.weekday() >= 5 or d in holidays
+    start = end = day
+    while is_off(start - timedelta(days=1)):
+        start -= timedelta(days=1)
+    while is_off(end + timedelta(days=1)):
+        end += timedelta(days=1)
+    return start, end
+
+def _next_yearly(today: date, make) -> Tuple[date, Optional[date]]:
+    """The first occurrence of a yearly stay that has not ended before today."""
+    for year in (today.year, today.year + 1):
+        start, end = make(year)
+        if (end or start) >= today:
+            return start, end
+    return make(today.year + 1)
+
+def _next_weekday(today: date, weekday: int) -> date:
+    return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+
+def _stay_match(pattern: re.Pattern, folded: str) -> Optional[re.Match]:
+    for match in pattern.finditer(folded):
+        if STAY_CONTEXT.search(folded[max(0, match.start() - 40):match.start()]):
+            return match
+    return None
+
+def resolve_relative(folded: str, today: date) -> Optional[Tuple[date, Optional[date]]]:
+    """Arrival and, when implied, departure for holiday and relative expressions anchored to today."""
+    long_weekend_asked = bool(LONG_WEEKEND.search(folded))
+    if WESTERN_EASTER.search(folded):
+        return _next_yearly(today, lambda year: (western_easter(year) - timedelta(days=2), western_easter(year) + timedelta(days=1)))
+    if HOLY_WEEK.search(folded):
+        return _next_yearly(today, lambda year: (orthodox_easter(year) - timedelta(days=6), orthodox_easter(year) + timedelta(days=1)))
+    if EASTER.search(folded):
+        return _next_yearly(today, lambda year: long_weekend(orthodox_easter(year)))
+    if WHIT_MONDAY.search(folded):
+        return _next_yearly(today, lambda year: long_weekend(orthodox_easter(year) + timedelta(days=50)))
+    if CLEAN_MONDAY.search(folded):
+        return _next_yearly(today, lambda year: long_weekend(orthodox_easter(year) - timedelta(days=48)))
+    for pattern, month, day in FIXED_HOLIDAYS:
+        if pattern.search(folded):
+            if long_weekend_asked:
+                return _next_yearly(today, lambda year: long_weekend(date(year, month, day)))
+            return _next_yearly(today, lambda year: (date(year, month, day), None))
+
+    match = _stay_match(RELATIVE_DAY, folded)
+    if match:
+        word = match.group(1)
+        offset = 2 if word in ('day after tomorrow', 'μεθαυριο') else 1 if word in ('tomorrow', 'αυριο') else 0
+        return today + timedelta(days=offset), None
+    match = _stay_match(IN_DAYS, folded)
+    if match:
+        amount = int(match.group(1))
+        return today + timedelta(days=amount * (7 if match.group(2).startswith(('week', 'εβδομαδ')) else 1)), None
+    match = _stay_match(WEEKEND, folded)
+    if match:
+        # A weekend stay runs Friday to Sunday; asked on a Saturday, "this weekend" is the one already under way
+        friday = today - timedelta(days=today.weekday() - 4) if today.weekday() in (4, 5) else _next_weekday(today, 4)
+        if match.group(2):
+            friday += timedelta(days=7)
+        return max(friday, today), friday + timedelta(days=2)
+    if _stay_match(NEXT_WEEK, folded):
+        return _next_weekday(today, 0), None
+    match = _stay_match(WEEKDAY, folded)
+    if match:
+        return _next_weekday(today, WEEKDAYS[match.group(1)]), None
+    return None
+
+
+def stay_candidates(folded: str, today: date) -> List[Tuple[date, Optional[date]]]:
+    """Every distinct stay the text could be asking for; two lone dates in order count as one check-in/check-out pair."""
+    matches = find_dates(folded, today)
+    candidates = [(match.start, match.end) for match in matches if match.end and match.end > match.start]
+    singles = [match.start for match in matches if not (match.end and match.end > match.start)]
+    if len(singles) == 2 and singles[1] > singles[0]:
+        candidates.append((singles[0], singles[1]))
+    else:
+        candidates.extend((single, None) for single in singles)
+    relative = resolve_relative(folded, today)
+    if relative:
+        candidates.append(relative)
+    return list(dict.fromkeys(candidates))
+
+def extract_offline(text: str, today: Optional[date] = None) -> Dict[str, Any]:
+    """Stay dates and guest counts from explicit dates, relative phrases, holidays and number words, without a model."""
+    today = today or reference_today()
+    folded = replace_number_words(normalize(text).folded)
+    reservation_info: Dict[str, Any] = {}
+
+    nights = NIGHTS.search(folded)
+    if nights:
+        reservation_info['nights'] = int(nights.group(1))
+    else:
+        weeks = WEEK_STAY.search(folded)
+        if weeks:
+            reservation_info['nights'] = 7 * int(weeks.group(1) or 1)
+    for key, pattern in (('adults', ADULTS), ('children', CHILDREN), ('rooms', ROOMS)):
+        match = pattern.search(folded)
+        if match:
+            reservation_info[key] = int(match.group(1))
+    party = PARTY.search(folded)
+    if party and 'adults' not in reservation_info:
+        adults = int(party.group(1)) - reservation_info.get('children', 0)
+        if adults > 0:
+            reservation_info['adults'] = adults
+
+    # Last year's stay quoted next to this year's, or a relative phrase next to explicit dates, is left to the model
+    candidates = stay_candidates(folded, today)
+    if len(candidates) != 1:
+        return reservation_info
+    stay = candidates[0]
+    if stay[1] is None and LONG_WEEKEND.search(folded):
+        stay = long_weekend(stay[0])
+    if stay:
+        check_in, check_out = stay
+        if check_out and 'nights' in reservation_info and (check_out - check_in).days != reservation_info['nights']:
+            # "3 nights" next to "10-14/8" contradicts itself; the model reads the whole message
+            return reservation_info
+        reservation_info['check_in'] = check_in
+        if check_out and check_out > check_in:
+            reservation_info['check_out'] = check_out
+            reservation_info.setdefault('nights', (check_out - check_in).days)
+        elif 'nights' in reservation_info:
+            reservation_info['check_out'] = check_in + timedelta(days=reservation_info['nights'])
+    return reservation_info
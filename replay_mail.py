@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import argparse
+import logging
+import tempfile
+import email.utils
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MBOX_FROM_ESCAPE = re.compile(rb'^>(>*From )', re.MULTILINE)
+EXTRACTORS = ('llm', 'email_processor_patterns', 'folder_patterns')
+AVAILABILITY_MODES = ('live', 'grid', 'none')
+REPLAY_STORE_PATH = os.getenv("REPLAY_STORE_PATH", "replay_reservations.sqlite3")
+
+
+def iter_mbox(path: str) -> Iterator[Tuple[str, bytes]]:
+    """Messages of an mbox file, read through a memory map one message at a time."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:5] == b'From ':
+                position = 0
+            else:
+                position = mm.find(b'\nFrom ')
+                if position == -1:
+                    return
+                position += 1
+            index = 0
+            while position < len(mm):
+                body_start = mm.find(b'\n', position) + 1 or len(mm)
+                next_from = mm.find(b'\nFrom ', body_start)
+                end = next_from + 1 if next_from != -1 else len(mm)
+                yield f"{path}#{index}", MBOX_FROM_ESCAPE.sub(rb'\1', mm[body_start:end])
+                index += 1
+                position = end
+
+def iter_maildir(path: str) -> Iterator[Tuple[str, bytes]]:
+    for folder in ('cur', 'new'):
+        directory = os.path.join(path, folder)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), 'rb') as f:
+                yield os.path.join(folder, name), f.read()
+
+def iter_eml_directory(path: str) -> Iterator[Tuple[str, bytes]]:
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith('.eml'):
+            with open(os.path.join(path, name), 'rb') as f:
+                yield name, f.read()
+
+def iter_source(path: str, source_format: str = 'auto') -> Iterator[Tuple[str, bytes]]:
+    if source_format == 'auto':
+        if not os.path.isdir(path):
+            source_format = 'mbox'
+        elif os.path.isdir(os.path.join(path, 'cur')) or os.path.isdir(os.path.join(path, 'new')):
+            source_format = 'maildir'
+        else:
+            source_format = 'eml'
+    return {'mbox': iter_mbox, 'maildir': iter_maildir, 'eml': iter_eml_directory}[source_format](path)
+
+
+@contextmanager
+def replaced(module, replacements: Dict[str, Any]):
+    """Swap module-level functions for the duration of the replay."""
+    originals = {name: getattr(module, name) for name in replacements}
+    for name, replacement in replacements.items():
+        setattr(module, name, replacement)
+    try:
+        yield
+    finally:
+        for name, original in originals.items():
+            setattr(module, name, original)
+
+def message_date(email_msg) -> Optional[date]:
+    try:
+        return email.utils.parsedate_to_datetime(str(email_msg['Date'])).date()
+    except (TypeError, ValueError):
+        return None
+
+def stage_replacements(extractor: str, availability: str, notifications: List[str], index, store) -> Dict[str, Any]:
+    """Stubs for the network stages. Staff mail is never sent during a replay; its subjects are recorded instead.
+
+    The dedupe index and reservation store are replay-only, so archived mail neither counts towards
+    demand analytics nor marks live inquiries as duplicates, and shadow extraction is switched off.
+    """
+    def record_notification(to_address, subject, body, *args, **kwargs):
+        notifications.append(subject)
+
+    replacements: Dict[str, Any] = {
+        'send_email': record_notification, 'send_email_with_original': record_notification,
+        'get_inquiry_index': lambda: index, 'get_reservation_store': lambda: store,
+        'submit_shadow': lambda body, reservation_info, message_id: None,
+    }
+    if extractor != 'llm':
+        from extractor_eval import get_extractor
+        extract = get_extractor(extractor)
+        if extract is None:
+            raise ValueError(f"Extractor {extractor} is unavailable")
+        replacements['extract_reservation_info'] = lambda body: {**(extract(body) or {}), 'extraction_source': extractor}
+    if availability == 'grid':
+        # Grid hits are still answered, misses come back empty instead of opening a browser
+        replacements['scrape_and_store'] = lambda check_in, check_out, adults, children, occupancy=None: {}
+    elif availability == 'none':
+        replacements['get_availability'] = lambda check_in, check_out, adults, children, occupancy=None: {}
+    return replacements
+
+def replay(source: str, output: str, source_format: str = 'auto', extractor: str = 'llm', availability: str = 'grid', limit: int = 0,
+           store_path: str = REPLAY_STORE_PATH) -> Dict[str, int]:
+    import demail_processor as pipeline
+    from date_grammar import reference_date_scope
+    from inquiry_dedupe import InquiryIndex
+    from reservation_store import ReservationStore
+
+    counts: Dict[str, int] = {}
+    notifications: List[str] = []
+    started = time.perf_counter()
+    store = ReservationStore(store_path)
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        index = InquiryIndex(os.path.join(workdir, "inquiry_index.json"))
+        try:
+            with replaced(pipeline, stage_replacements(extractor, availability, notifications, index, store)), open(output, 'w', encoding='utf-8') as out:
+                for position, (key, raw) in enumerate(iter_source(source, source_format)):
+                    if limit and position >= limit:
+                        break
+                    notifications.clear()
+                    try:
+                        email_msg = pipeline.parse_email_bytes(raw)
+                        sender = email.utils.parseaddr(email_msg['From'] or '')[1]
+                        # "Next weekend" in an archived message means the weekend after it was sent
+                        with reference_date_scope(message_date(email_msg)):
+                            result = pipeline.process_email(email_msg, sender)
+                    except Exception as e:
+                        logger.error(f"Failed to replay {key}: {type(e).__name__}: {e}")
+                        result = {'outcome': 'replay_error', 'error': f"{type(e).__name__}: {e}"}
+                    result.update(source=key, notifications=list(notifications))
+                    out.write(json.dumps(result, ensure_ascii=False, default=str) + '\n')
+                    counts[result['outcome']] = counts.get(result['outcome'], 0) + 1
+        finally:
+            store.close()
+    total = sum(counts.values())
+    elapsed = time.perf_counter() - started
+    logger.warning(f"Replayed {total} messages in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s): {counts}")
+    return counts
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run archived mail through process_email without touching IMAP or SMTP")
+    arg_parser.add_argument("source", help="mbox file, maildir, or directory of .eml files")
+    arg_parser.add_argument("--format", dest="source_format", choices=('auto', 'mbox', 'maildir', 'eml'), default='auto')
+    arg_parser.add_argument("--output", default="replay_results.jsonl", help="JSONL file with one result per message")
+    arg_parser.add_argument("--extractor", choices=EXTRACTORS, default='llm', help="Use a local extractor instead of the LLM")
+    arg_parser.add_argument("--availability", choices=AVAILABILITY_MODES, default='grid',
+                            help="live scrapes on grid misses, grid answers from the prefetched grid only, none skips availability")
+    arg_parser.add_argument("--limit", type=int, default=0, help="Stop after this many messages")
+    arg_parser.add_argument("--store", default=REPLAY_STORE_PATH, help="Replay-only reservation store; never the live one")
+    args = arg_parser.parse_args()
+
+    # The pipeline checks these at import and per message; neither is used once the LLM and SMTP stages are stubbed
+    if args.extractor != 'llm':
+        os.environ.setdefault("OPEN_ROUTER_API_KEY", "offline-replay")
+    os.environ.setdefault("STAFF_EMAIL", "replay@localhost")
+    counts = replay(args.source, args.output, args.source_format, args.extractor, args.availability, args.limit, args.store)
+    return 0 if counts else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
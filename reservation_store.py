@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import date
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_DB_PATH = os.getenv("RESERVATION_DB_PATH", "reservations.sqlite3")
+STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", "50"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inquiries (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    processed_at REAL NOT NULL,
+    outcome TEXT,
+    extraction_source TEXT,
+    check_in TEXT,
+    check_out TEXT,
+    adults INTEGER,
+    children INTEGER,
+    reservation_info TEXT,
+    availability TEXT,
+    extract_ms INTEGER,
+    availability_ms INTEGER,
+    total_ms INTEGER
+);
+CREATE INDEX IF NOT EXISTS inquiries_check_in ON inquiries (check_in);
+CREATE INDEX IF NOT EXISTS inquiries_sender ON inquiries (sender, processed_at);
+CREATE INDEX IF NOT EXISTS inquiries_message_id ON inquiries (message_id);
+"""
+COLUMNS = (
+    'message_id', 'sender', 'processed_at', 'outcome', 'extraction_source', 'check_in', 'check_out',
+    'adults', 'children', 'reservation_info', 'availability', 'extract_ms', 'availability_ms', 'total_ms',
+)
+INSERT = f"INSERT INTO inquiries ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})"
+
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, date) else value
+
+def _json(value: Any) -> Optional[str]:
+    return json.dumps(value, ensure_ascii=False, default=str, separators=(',', ':')) if value else None
+
+def _ms(seconds: Optional[float]) -> Optional[int]:
+    return round(seconds * 1000) if seconds is not None else None
+
+def result_row(result: Dict[str, Any], processed_at: Optional[float] = None) -> tuple:
+    """Flatten a process_email result into an inquiries row."""
+    info = result.get('reservation_info') or {}
+    timings = result.get('timings', {})
+    return (
+        result.get('message_id', ''),
+        result.get('sender', ''),
+        processed_at or time.time(),
+        result.get('outcome'),
+        info.get('extraction_source'),
+        _iso(info.get('check_in')),
+        _iso(info.get('check_out')),
+        info.get('adults'),
+        info.get('children'),
+        _json(info),
+        _json(result.get('availability')),
+        _ms(timings.get('extract')),
+        _ms(timings.get('availability')),
+        _ms(timings.get('total')),
+    )
+
+
+class ReservationStore:
+    """Every processed inquiry with its extraction, availability snapshot and timings, in SQLite."""
+
+    def __init__(self, path: str = RESERVATION_DB_PATH, batch_size: int = STORE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending: List[tuple] = []
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def record(self, result: Dict[str, Any], processed_at: Optional[float] = None) -> None:
+        with self.lock:
+            self.pending.append(result_row(result, processed_at))
+            if len(self.pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(INSERT, self.pending)
+        logger.info(f"Stored {len(self.pending)} inquiries in {self.path}")
+        self.pending = []
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        # Pending rows are flushed first so queries see everything recorded so far
+        with self.lock:
+            self._flush_locked()
+            return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def find_by_message_id(self, message_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM inquiries WHERE message_id = ? ORDER BY processed_at DESC LIMIT 1", (message_id,))
+        return rows[0] if rows else None
+
+    def recent_from_sender(self, sender: str, since_seconds: float) -> List[Dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM inquiries WHERE sender = ? AND processed_at >= ? ORDER BY processed_at DESC",
+            (sender, time.time() - since_seconds),
+        )
+
+    def inquiries_for_check_in(self, start: date, end: date) -> List[Dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM inquiries WHERE check_in >= ? AND check_in < ? ORDER BY check_in",
+            (start.isoformat(), end.isoformat()),
+        )
+
+    def outcome_counts(self, since_seconds: float) -> Dict[str, int]:
+        rows = self._query(
+            "SELECT outcome, COUNT(*) AS count FROM inquiries WHERE processed_at >= ? GROUP BY outcome",
+            (time.time() - since_seconds,),
+        )
+        return {row['outcome']: row['count'] for row in rows}
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+_store: Optional[ReservationStore] = None
+
+def get_reservation_store() -> ReservationStore:
+    global _store
+    if _store is None:
+        _store = ReservationStore()
+    return _store
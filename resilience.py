@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EMAIL_DEADLINE_SECONDS = float(os.getenv("EMAIL_DEADLINE_SECONDS", "120"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "300"))
+# Per-host token buckets as host=requests_per_second:burst; hosts not listed are not paced
+RATE_LIMITS = os.getenv("RATE_LIMITS", "openrouter.ai=2:5,thekokoonvolos.reserve-online.net=0.5:2")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class Deadline:
+    """Wall-clock budget shared by every stage that works on the same email."""
+
+    def __init__(self, seconds: Optional[float]):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float('inf')
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float, floor: Optional[float] = None) -> float:
+        """Timeout for the next call: at most `cap`, never past the deadline.
+
+        With a floor the call is always allowed at least that long, for stages such as the staff
+        notification that must still run after the budget is spent.
+        """
+        remaining = self.remaining()
+        if floor is not None:
+            return max(min(cap, remaining), floor)
+        if remaining <= 0:
+            raise DeadlineExceeded("Per-email deadline exceeded")
+        return min(cap, remaining)
+
+
+_local = threading.local()
+
+@contextmanager
+def deadline_scope(seconds: float = EMAIL_DEADLINE_SECONDS):
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = Deadline(seconds)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+def current_deadline() -> Deadline:
+    return getattr(_local, 'deadline', None) or Deadline(None)
+
+
+class CircuitBreaker:
+    """Stops calling a dependency after repeated failures and lets one trial call through after a cooldown."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+
+    def allow(self) -> None:
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_seconds or self.trial_in_progress:
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            self.trial_in_progress = True
+            logger.info(f"{self.name} circuit half-open, allowing a trial call")
+
+    def record_success(self) -> None:
+        with self.lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.name} circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logger.warning(f"{self.name} circuit open after {self.failures} failures")
+
+    def release(self) -> None:
+        """End a call that ended without saying anything about the dependency's health, e.g. on a spent deadline.
+
+        Every allow() must be followed by record_success, record_failure or release, or a half-open
+        circuit keeps its trial slot forever and never closes.
+        """
+        with self.lock:
+            self.trial_in_progress = False
+
+
+class RateLimiter:
+    """Token bucket shared by every thread and event loop in the process.
+
+    A caller reserves its token up front, possibly driving the bucket below zero, and then sleeps
+    outside the lock until its turn; callers are served in arrival order and nobody sleeps holding it.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _reserve(self, max_wait: float = float('inf')) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise DeadlineExceeded(f"{self.name} rate limit wait of {wait:.1f}s exceeds the deadline")
+            self.tokens -= 1
+            self.acquired += 1
+            if wait > 0:
+                self.delayed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def acquire(self, deadline: Optional[Deadline] = None) -> float:
+        """Block until a request may be sent; returns the seconds waited."""
+        wait = self._reserve(deadline.remaining() if deadline else float('inf'))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, deadline: Optional[Deadline] = None) -> float:
+        wait = self._reserve(deadline.remaining() if deadline else float('inf'))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                'acquired': self.acquired, 'delayed': self.delayed, 'total_wait': self.total_wait,
+                'average_wait': self.total_wait / self.acquired if self.acquired else 0.0, 'max_wait': self.max_wait,
+            }
+
+    def share(self, name: str, fraction: float) -> 'SharedRateLimiter':
+        """A limiter for background work that may use at most `fraction` of this one's rate."""
+        return SharedRateLimiter(name, self, fraction)
+
+
+class SharedRateLimiter(RateLimiter):
+    """Takes a token from its own, smaller bucket and then from the parent, so the host's total limit still holds."""
+
+    def __init__(self, name: str, parent: RateLimiter, fraction: float):
+        super().__init__(name, parent.rate * fraction, 1)
+        self.parent = parent
+
+    def acquire(self, deadline: Optional[Deadline] = None) -> float:
+        return super().acquire(deadline) + self.parent.acquire(deadline)
+
+    async def acquire_async(self, deadline: Optional[Deadline] = None) -> float:
+        return await super().acquire_async(deadline) + await self.parent.acquire_async(deadline)
+
+
+def parse_rate_limits(spec: str) -> Dict[str, RateLimiter]:
+    limiters = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        host, _, limit = entry.partition('=')
+        rate, _, burst = limit.partition(':')
+        limiters[host.strip()] = RateLimiter(host.strip(), float(rate), int(burst or 1))
+    return limiters
+
+_rate_limiters = parse_rate_limits(RATE_LIMITS)
+
+def rate_limiter(host: str) -> Optional[RateLimiter]:
+    return _rate_limiters.get(host)
+
+def log_rate_limit_stats() -> None:
+    for host, limiter in _rate_limiters.items():
+        stats = limiter.stats()
+        logger.info(f"Rate limit {host}: {stats['acquired']} requests, {stats['delayed']} delayed, "
+                    f"{stats['total_wait']:.1f}s waited ({stats['average_wait']:.2f}s average, {stats['max_wait']:.2f}s max)")
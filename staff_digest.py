@@ -0,0 +1,123 @@
+import os
+import time
+import html
+import logging
+import textwrap
+import threading
+from datetime import date
+from string import Template
+from email.mime.multipart import MIMEMultipart
+from email.mime.message import MIMEMessage
+from email.mime.text import MIMEText
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+STAFF_DIGEST_MODE = os.getenv("STAFF_DIGEST_MODE", "0") == "1"
+# Requests arriving within this many days are still sent to staff straight away
+DIGEST_URGENT_DAYS = int(os.getenv("DIGEST_URGENT_DAYS", "3"))
+# A long-running process sends the collected digest once its oldest entry is this old
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", "3600"))
+
+DIGEST_TEXT = Template("""Reservation requests collected: $count
+
+$summary
+
+$entries
+""")
+SUMMARY_TEXT = Template("- $sender | check-in $check_in | check-out $check_out | adults $adults | children $children | $subject")
+ENTRY_TEXT = Template("""==== $subject ====
+$body
+""")
+DIGEST_HTML = Template("""<html><body>
+<h2>Reservation requests collected: $count</h2>
+<table border="1" cellpadding="4" cellspacing="0">
+<tr><th>Sender</th><th>Check-in</th><th>Check-out</th><th>Adults</th><th>Children</th><th>Notification</th></tr>
+$rows
+</table>
+$entries
+<p>The original messages are attached in the same order.</p>
+</body></html>
+""")
+SUMMARY_HTML = Template("<tr><td>$sender</td><td>$check_in</td><td>$check_out</td><td>$adults</td><td>$children</td><td>$subject</td></tr>")
+ENTRY_HTML = Template("<h3>$subject</h3>\n<pre>$body</pre>")
+
+
+def is_urgent(reservation_info: Optional[Dict[str, Any]], today: Optional[date] = None) -> bool:
+    check_in = (reservation_info or {}).get('check_in')
+    if not isinstance(check_in, date):
+        return False
+    return (check_in - (today or date.today())).days <= DIGEST_URGENT_DAYS
+
+
+class StaffDigest:
+    """Staff notifications held back during a run and sent together as one message."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: List[Dict[str, Any]] = []
+        self.started_at: Optional[float] = None
+
+    def add(self, subject: str, body: str, original_email, reservation_info: Optional[Dict[str, Any]] = None) -> None:
+        info = reservation_info or {}
+        with self.lock:
+            if not self.entries:
+                self.started_at = time.monotonic()
+            self.entries.append({
+                'subject': subject,
+                'body': textwrap.dedent(body).strip(),
+                'original_email': original_email,
+                'sender': str(original_email.get('From', '')) if original_email is not None else '',
+                'check_in': info.get('check_in'),
+                'check_out': info.get('check_out'),
+                'adults': info.get('adults'),
+                'children': info.get('children'),
+            })
+        logger.info(f"Added to staff digest ({len(self.entries)} pending): {subject}")
+
+    def due(self) -> bool:
+        with self.lock:
+            return bool(self.entries) and time.monotonic() - self.started_at >= DIGEST_WINDOW_SECONDS
+
+    def take(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            entries, self.entries, self.started_at = self.entries, [], None
+        # Soonest arrivals first, requests without dates at the end
+        return sorted(entries, key=lambda entry: entry['check_in'] if isinstance(entry['check_in'], date) else date.max)
+
+
+def _fields(entry: Dict[str, Any], escape) -> Dict[str, str]:
+    return {
+        key: escape(str(entry[key] if entry[key] is not None else '-'))
+        for key in ('subject', 'body', 'sender', 'check_in', 'check_out', 'adults', 'children')
+    }
+
+def render_digest(entries: List[Dict[str, Any]], sender_email: str, to_address: str) -> MIMEMultipart:
+    plain = [_fields(entry, str) for entry in entries]
+    escaped = [_fields(entry, html.escape) for entry in entries]
+    text = DIGEST_TEXT.substitute(
+        count=len(entries),
+        summary='\n'.join(SUMMARY_TEXT.substitute(fields) for fields in plain),
+        entries='\n'.join(ENTRY_TEXT.substitute(fields) for fields in plain),
+    )
+    html_body = DIGEST_HTML.substitute(
+        count=len(entries),
+        rows='\n'.join(SUMMARY_HTML.substitute(fields) for fields in escaped),
+        entries='\n'.join(ENTRY_HTML.substitute(fields) for fields in escaped),
+    )
+
+    message = MIMEMultipart('mixed')
+    message["From"] = sender_email
+    message["To"] = to_address
+    message["Subject"] = f"Reservation Requests Digest - {len(entries)} requests"
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText(text, "plain", "utf-8"))
+    alternative.attach(MIMEText(html_body, "html", "utf-8"))
+    message.attach(alternative)
+    for entry in entries:
+        if entry['original_email'] is not None:
+            message.attach(MIMEMessage(entry['original_email']))
+    return message
+
+
+staff_digest = StaffDigest()
@@ -0,0 +1,55 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple
+
+NORMALIZE_CACHE_SIZE = int(os.getenv("NORMALIZE_CACHE_SIZE", "256"))
+
+# Blocks whose characters can fold to something else: Latin-1 and Latin Extended, combining marks,
+# Greek and polytonic Greek, general punctuation, ligatures and fullwidth forms
+FOLDED_RANGES = (
+    (0x00A0, 0x0250), (0x0300, 0x0400), (0x1E00, 0x2070), (0xFB00, 0xFB07), (0xFF00, 0xFFF0),
+)
+GREEK_LETTER = re.compile(r'[α-ω]')
+LATIN_LETTER = re.compile(r'[a-z]')
+
+
+def _build_fold_table() -> dict:
+    table = {}
+    for start, end in FOLDED_RANGES:
+        for code in range(start, end):
+            char = chr(code)
+            folded = ''.join(c for c in unicodedata.normalize('NFKD', char.lower()) if unicodedata.category(c) != 'Mn').lower()
+            if folded != char:
+                table[code] = folded
+    table[ord('ς')] = 'σ'
+    return table
+
+# Applied to lowercased text: strips accents and compatibility forms, and folds final sigma
+FOLD_TABLE = _build_fold_table()
+
+
+class NormalizedText(NamedTuple):
+    folded: str
+    greek_letters: int
+    latin_letters: int
+
+    @property
+    def is_greek(self) -> bool:
+        return self.greek_letters > 0
+
+    @property
+    def language(self) -> str:
+        return 'el' if self.greek_letters and self.greek_letters >= self.latin_letters else 'en'
+
+
+def fold(text: str) -> str:
+    """Lowercase, accent-stripped, final-sigma-folded text."""
+    return text.lower().translate(FOLD_TABLE)
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize(text: str) -> NormalizedText:
+    """Folded text plus script counts, computed once per distinct text and shared by every parser."""
+    folded = fold(text)
+    return NormalizedText(folded, len(GREEK_LETTER.findall(folded)), len(LATIN_LETTER.findall(folded)))